@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+مقارنة عدد الطلبات في الثانية بين عميل جديد لكل طلب (السلوك القديم)
+والعميل المشترك في APIClient، مقابل خادم وهمي محلي
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from benchmarks.stub_upstream import StubUpstream, serve_stub  # noqa: E402
+
+
+async def per_call_client(base_url: str, endpoint: str, params: dict):
+    """السلوك القديم: عميل جديد ومصافحة TCP جديدة لكل طلب"""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(f"{base_url}/{endpoint}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+async def run_load(call, total: int, concurrency: int) -> float:
+    """تنفيذ عدد ثابت من الطلبات بتزامن محدد وإرجاع عدد الطلبات في الثانية
+
+    كل طلب يحمل معاملاً مختلفاً حتى لا يُدمج مع غيره (single-flight) فيُقاس الاتصال وحده.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            await call({"n": index})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    stub = StubUpstream(latency_ms=args.latency_ms, rows=args.rows)
+    server = await serve_stub(stub, port=args.port)
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    try:
+        before = await run_load(lambda params: per_call_client(base_url, "CountryCode", params), args.requests, args.concurrency)
+
+        client = main.APIClient()
+        client.base_url = base_url
+        # قياس تجميع الاتصالات وحده: بدون ذاكرة مؤقتة تتحول كل الطلبات إلى إصابات
+        client.cache = main.ResponseCache({})
+        client.shared = None
+        await client.start()
+        try:
+            after = await run_load(lambda params: client.get("CountryCode", params), args.requests, args.concurrency)
+        finally:
+            await client.close()
+    finally:
+        server.should_exit = True
+        await server.task
+
+    print(f"requests={args.requests} concurrency={args.concurrency} latency_ms={args.latency_ms}")
+    print(f"before (client per call): {before:8.1f} req/s")
+    print(f"after  (pooled client)  : {after:8.1f} req/s")
+    print(f"speedup                 : {after / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+قياس زمن تسلسل الغلاف وحجم البايتات المرسلة لأحجام حمولات نموذجية:
+JSONResponse مقابل ORJSONResponse، ودون ضغط مقابل gzip وbrotli
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from benchmarks.stub_upstream import make_rows  # noqa: E402
+
+try:
+    from fastapi.responses import ORJSONResponse
+    import orjson  # noqa: F401
+except ImportError:
+    ORJSONResponse = None
+
+
+def best_of(func, repeat: int) -> float:
+    """أفضل زمن (بالمللي ثانية) من عدة تكرارات"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def gzip_bytes(body: bytes) -> bytes:
+    compressor = zlib.compressobj(main.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def main_cli(args):
+    print(f"{'rows':>7} {'raw KB':>9} {'gzip KB':>9} {'br KB':>9} "
+          f"{'json ms':>9} {'orjson ms':>10} {'gzip ms':>9} {'br ms':>9}")
+    for rows in args.rows:
+        envelope = {"students": make_rows(rows, "student"), "status": "success"}
+        body = JSONResponse(envelope).body
+        json_ms = best_of(lambda: JSONResponse(envelope), args.repeat)
+        orjson_ms = best_of(lambda: ORJSONResponse(envelope), args.repeat) if ORJSONResponse else float("nan")
+        gzip_ms = best_of(lambda: gzip_bytes(body), args.repeat)
+        gzip_kb = len(gzip_bytes(body)) / 1024
+        if main.brotli is not None:
+            quality = main.COMPRESSION_BROTLI_QUALITY
+            br_ms = best_of(lambda: main.brotli.compress(body, quality=quality), args.repeat)
+            br_kb = len(main.brotli.compress(body, quality=quality)) / 1024
+        else:
+            br_ms = br_kb = float("nan")
+        print(f"{rows:>7} {len(body) / 1024:>9.1f} {gzip_kb:>9.1f} {br_kb:>9.1f} "
+              f"{json_ms:>9.2f} {orjson_ms:>10.2f} {gzip_ms:>9.2f} {br_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    main_cli(parser.parse_args())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+اختبار حمل قابل للتكرار للخادم الخلفي مقابل خادم وهمي محلي
+
+يشغّل الخادم الوهمي والتطبيق كعمليتين منفصلتين، ثم ينفذ مزيجاً من الطلبات
+(تصفح الكتالوج، عمليات الشكاوى، جلب الصور) ويقيس الإنتاجية وزمن الاستجابة
+(p50/p95/p99) والذاكرة المستخدمة. تُحفظ النتائج في benchmarks/results
+وتُقارن بآخر تشغيل سابق لاكتشاف أي تراجع في الأداء.
+
+مثال:
+    python benchmarks/load_test.py --mix catalogue --duration 20 --concurrency 50
+    python benchmarks/load_test.py --mix all --latency-ms 20 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# مزيج الطلبات: (الوزن، الطريقة، المسار، جسم الطلب)
+# limit/offset فقط على المسارات التي تدعم الترقيم (list_query)؛ غيرها يعيد القائمة كاملة
+CATALOGUE_MIX = [
+    (20, "GET", "/courses", None),
+    (10, "GET", "/program-details?limit=50", None),
+    (15, "GET", "/courses/{id}", None),
+    (10, "GET", "/course-masters", None),
+    (10, "GET", "/course-masters/{id}/courses", None),
+    (10, "GET", "/programs", None),
+    (5, "GET", "/branches", None),
+    (5, "GET", "/countries", None),
+    (10, "GET", "/search?q=course", None),
+    (5, "GET", "/bootstrap", None),
+]
+
+COMPLAINTS_MIX = [
+    (40, "GET", "/complaints", None),
+    (15, "GET", "/complaints/{id}", None),
+    (10, "GET", "/complaints/stats", None),
+    (15, "POST", "/complaints", {"studentId": 1, "typeId": 1, "statusId": 1, "description": "load test"}),
+    (15, "PUT", "/complaints/{id}", {"statusId": 2, "description": "load test"}),
+    (5, "DELETE", "/complaints/{id}", None),
+]
+
+IMAGES_MIX = [
+    (70, "GET", "/courses/{id}/image", None),
+    (30, "GET", "/complaints/{id}/file", None),
+]
+
+MIXES = {
+    "catalogue": CATALOGUE_MIX,
+    "complaints": COMPLAINTS_MIX,
+    "images": IMAGES_MIX,
+    "all": CATALOGUE_MIX + COMPLAINTS_MIX + IMAGES_MIX,
+}
+
+
+def free_port() -> int:
+    """حجز منفذ محلي غير مستخدم"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid: int):
+    """قراءة الذاكرة المقيمة لعملية (لينكس فقط)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """حساب النسبة المئوية من قائمة مرتبة"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def start_process(args, env_extra, log_path: str, cwd=ROOT):
+    """تشغيل عملية فرعية بمتغيرات بيئة إضافية، مع توجيه مخرجاتها إلى ملف سجل"""
+    env = dict(os.environ)
+    env.update(env_extra)
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log_path = log_path
+    return process
+
+
+async def wait_ready(url: str, process, timeout: float = 30.0):
+    """الانتظار حتى يستجيب الخادم"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                with open(process.log_path, errors="replace") as log:
+                    raise RuntimeError(log.read())
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+async def run_mix(base_url: str, mix, duration: float, concurrency: int, rows: int, seed: int, app_pid: int):
+    """تنفيذ المزيج لمدة محددة وجمع القياسات"""
+    rng = random.Random(seed)
+    weights = [entry[0] for entry in mix]
+    latencies = {}
+    errors = {}
+    peak_rss = [rss_kb(app_pid) or 0]
+    deadline = time.perf_counter() + duration
+
+    async def worker(client):
+        while time.perf_counter() < deadline:
+            _, method, path, body = rng.choices(mix, weights)[0]
+            url = path.replace("{id}", str(rng.randint(1, rows)))
+            label = f"{method} {path}"
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.setdefault(label, []).append(time.perf_counter() - started)
+            if failed:
+                errors[label] = errors.get(label, 0) + 1
+
+    async def sample_memory():
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.25)
+            peak_rss[0] = max(peak_rss[0], rss_kb(app_pid) or 0)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(sample_memory(), *(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    def summarize(values, failures):
+        values = sorted(values)
+        return {
+            "requests": len(values),
+            "errors": failures,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+
+    all_values = [value for values in latencies.values() for value in values]
+    total = summarize(all_values, sum(errors.values()))
+    total["throughput_rps"] = round(len(all_values) / elapsed, 1)
+    total["peak_rss_mb"] = round(peak_rss[0] / 1024, 1)
+    total["routes"] = {label: summarize(values, errors.get(label, 0)) for label, values in sorted(latencies.items())}
+    return total
+
+
+def latest_result(mix_name: str):
+    """آخر نتيجة محفوظة لنفس المزيج (للمقارنة)"""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    names = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith(f"-{mix_name}.json"))
+    if not names:
+        return None
+    with open(os.path.join(RESULTS_DIR, names[-1])) as f:
+        return json.load(f)
+
+
+def compare(current, previous, threshold: float):
+    """مقارنة النتيجة الحالية بالسابقة وإرجاع قائمة التراجعات"""
+    regressions = []
+    lines = []
+    for key, higher_is_better in (("throughput_rps", True), ("p50_ms", False), ("p95_ms", False),
+                                  ("p99_ms", False), ("peak_rss_mb", False)):
+        before, after = previous["result"].get(key), current["result"].get(key)
+        if not before:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        marker = "  REGRESSION" if worse > threshold else ""
+        lines.append(f"  {key:15s} {before:10.1f} -> {after:10.1f} ({change:+.1%}){marker}")
+        if marker:
+            regressions.append(key)
+    return lines, regressions
+
+
+async def main_async(args):
+    stub_port, app_port = free_port(), free_port()
+    shared_dir = tempfile.mkdtemp(prefix="load-test-")
+    stub = start_process(
+        [sys.executable, "-m", "benchmarks.stub_upstream"],
+        {
+            "PORT": str(stub_port),
+            "STUB_LATENCY_MS": str(args.latency_ms),
+            "STUB_ROWS": str(args.rows),
+            "STUB_ERROR_RATE": str(args.error_rate),
+            "STUB_IMAGE_BYTES": str(args.image_bytes),
+        },
+        os.path.join(shared_dir, "stub.log"),
+    )
+    app = start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning", "--no-access-log"],
+        {
+            "EXTERNAL_API_BASE": f"http://127.0.0.1:{stub_port}/api",
+            "WARM_SHARED_DIR": shared_dir,
+            "LKG_SNAPSHOT_PATH": os.path.join(shared_dir, "lkg.json"),
+        },
+        os.path.join(shared_dir, "app.log"),
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await wait_ready(f"http://127.0.0.1:{stub_port}/api/CountryCode", stub)
+        await wait_ready(f"{base_url}/", app)
+        if args.warmup:
+            await run_mix(base_url, MIXES[args.mix], args.warmup, args.concurrency, args.rows, args.seed, app.pid)
+        result = await run_mix(base_url, MIXES[args.mix], args.duration, args.concurrency, args.rows,
+                               args.seed, app.pid)
+    finally:
+        for process in (app, stub):
+            process.terminate()
+            process.wait(timeout=10)
+
+    current = {
+        "mix": args.mix,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: getattr(args, key) for key in
+                   ("duration", "concurrency", "latency_ms", "rows", "error_rate", "image_bytes", "seed")},
+        "result": result,
+    }
+
+    print(f"mix={args.mix} duration={args.duration}s concurrency={args.concurrency} "
+          f"latency_ms={args.latency_ms} error_rate={args.error_rate}")
+    print(f"throughput : {result['throughput_rps']:10.1f} req/s ({result['requests']} requests, "
+          f"{result['errors']} errors)")
+    print(f"latency    : p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms")
+    print(f"peak RSS   : {result['peak_rss_mb']} MB")
+    for label, stats in result["routes"].items():
+        print(f"  {label:38s} n={stats['requests']:6d} err={stats['errors']:4d} "
+              f"p50={stats['p50_ms']:8.2f} p95={stats['p95_ms']:8.2f} p99={stats['p99_ms']:8.2f}")
+
+    previous = latest_result(args.mix)
+    regressions = []
+    if previous and previous["config"] == current["config"]:
+        lines, regressions = compare(current, previous, args.threshold)
+        print(f"compared with {previous['timestamp']}:")
+        print("\n".join(lines))
+    elif previous:
+        print("previous result used a different configuration; skipping comparison")
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.mix}.json")
+        with open(path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"saved {os.path.relpath(path, ROOT)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="all")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--image-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=0.10, help="نسبة التراجع المسموح بها قبل الإبلاغ")
+    parser.add_argument("--no-save", dest="save", action="store_false")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
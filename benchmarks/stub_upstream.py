@@ -0,0 +1,133 @@
+"""
+خادم وهمي محلي يحاكي مسارات /api/* الخاصة بـ API الخارجي لأغراض القياس
+
+يدعم زمن استجابة وحجم حمولة ونسبة أخطاء قابلة للضبط:
+القوائم (/api/<Resource>)، العنصر الواحد (/api/<Resource>/<id>)، الصور والملفات
+(/api/<Resource>/<id>/image|file)، العدّ (/api/<Resource>/count/<id>)، وعمليات POST/PUT/DELETE.
+"""
+
+import asyncio
+import json
+import os
+import random
+
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+STUB_ROWS = int(os.getenv("STUB_ROWS", "50"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_IMAGE_BYTES = int(os.getenv("STUB_IMAGE_BYTES", str(64 * 1024)))
+
+
+def make_rows(count: int, resource: str = "item"):
+    """توليد صفوف تشبه بيانات API الخارجي"""
+    return [
+        {
+            "id": i,
+            "name": f"{resource} {i}",
+            "description": "وصف تجريبي " * 4,
+            "masterId": i % 10 + 1,
+            "statusId": i % 4 + 1,
+            "typeId": i % 3 + 1,
+            "branchId": i % 5 + 1,
+            "date": f"2026-01-{i % 28 + 1:02d}T10:00:00",
+            "active": True,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+class StubUpstream:
+    """تطبيق ASGI بسيط يحاكي API الخارجي"""
+
+    def __init__(self, latency_ms: float = STUB_LATENCY_MS, rows: int = STUB_ROWS,
+                 error_rate: float = STUB_ERROR_RATE, image_bytes: int = STUB_IMAGE_BYTES):
+        self.latency_ms = latency_ms
+        self.rows = rows
+        self.error_rate = error_rate
+        self.image = bytes(range(256)) * (image_bytes // 256 + 1)
+        self.image = self.image[:image_bytes]
+        self.requests = 0
+        self._bodies = {}
+
+    def _list_body(self, resource: str) -> bytes:
+        body = self._bodies.get(resource)
+        if body is None:
+            body = json.dumps(make_rows(self.rows, resource), ensure_ascii=False).encode("utf-8")
+            self._bodies[resource] = body
+        return body
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            await self._send(send, 500, b'{"error": "stub failure"}')
+            return
+
+        parts = [part for part in scope["path"].split("/") if part][1:]
+        resource = parts[0] if parts else "item"
+        method = scope["method"]
+        if method in ("POST", "PUT"):
+            payload = json.loads(await self._read_body(receive) or b"{}")
+            if method == "POST":
+                payload.setdefault("id", random.randint(100000, 999999))
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        elif method == "DELETE":
+            body = b"true"
+        elif parts and parts[-1] in ("image", "file"):
+            await self._send(send, 200, self.image, b"image/png")
+            return
+        elif len(parts) >= 3 and parts[1] == "count":
+            body = str(self.rows // 4).encode()
+        elif len(parts) >= 2 and parts[1].isdigit():
+            row = make_rows(1, resource)[0]
+            row["id"] = int(parts[1])
+            body = json.dumps(row, ensure_ascii=False).encode("utf-8")
+        else:
+            body = self._list_body(resource)
+        await self._send(send, 200, body)
+
+    @staticmethod
+    async def _send(send, status: int, body: bytes, content_type: bytes = b"application/json"):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def serve_stub(stub: StubUpstream, host: str = "127.0.0.1", port: int = 8765):
+    """تشغيل الخادم الوهمي داخل حلقة الأحداث الحالية وإرجاع كائن الخادم"""
+    import uvicorn
+
+    config = uvicorn.Config(stub, host=host, port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    server.task = task
+    return server
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(StubUpstream(), host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "8765")),
+                log_level="warning")
@@ -1,12 +1,98 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers, MutableHeaders
 import httpx
+import aiofiles
+import aiofiles.os
 import os
 from typing import List, Optional, Dict, Any
 import asyncio
+import base64
+import heapq
+import sys
+import threading
+import bisect
+import re
+import random
+import tempfile
+import fnmatch
+import hashlib
+import json
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import formatdate
 
-app = FastAPI(title="Academy of Creativity API", version="1.0.0")
+try:
+    import brotli
+except ImportError:  # brotli اختياري؛ يُستخدم gzip فقط
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: لا أقفال ملفات؛ كل عامل يحدّث بنفسه
+    fcntl = None
+
+# مسلسل JSON أسرع (orjson) عند تثبيته، وإلا المسلسل الافتراضي
+FAST_JSON = os.getenv("FAST_JSON", "true").lower() == "true"
+try:
+    if not FAST_JSON:
+        raise ImportError("FAST_JSON disabled")
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse
+
+# توقيت مراحل الطلب عند تفعيل التحليل (انتظار API الخارجي، فك ترميز JSON، تسلسل الغلاف)
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def profile_phase(name: str):
+    """إضافة زمن الكتلة إلى مرحلة في توقيت الطلب الحالي؛ دون تكلفة تُذكر إذا لم يكن التحليل مفعلاً"""
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class ProfiledJSONResponse(DefaultJSONResponse):
+    def render(self, content: Any) -> bytes:
+        with profile_phase("serialize"):
+            return super().render(content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """فتح العميل المشترك لـ API الخارجي وتحميل آخر نسخة سليمة عند البدء، وإغلاقهما عند الإيقاف"""
+    await api_client.start()
+    await api_client.last_known_good.start()
+    await cache_warmer.start()
+    try:
+        yield
+    finally:
+        await change_feeds.close()
+        await cache_warmer.close()
+        await api_client.last_known_good.close()
+        await api_client.close()
+
+
+app = FastAPI(
+    title="Academy of Creativity API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ProfiledJSONResponse,
+)
 
 # إعداد CORS للسماح بالوصول من الواجهة الأمامية
 app.add_middleware(
@@ -17,6 +103,460 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# الطلبات الشرطية: ETag محسوب من محتوى الاستجابة ورد 304 عند تطابق If-None-Match
+ETAG_MAX_BYTES = int(os.getenv("ETAG_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """مقارنة ضعيفة كما في RFC 9110: تجاهل البادئة W/ ودعم القائمة و *"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+
+class ETagMiddleware:
+    """إضافة ETag لاستجابات JSON الناجحة التي يسلسلها التطبيق، وإرجاع 304 دون جسم عند التطابق
+
+    الاستجابات المبثوثة (دون Content-Length أو على عدة أجزاء) وغير JSON (الصور والمرفقات)
+    أو التي تحمل ETag مسبقاً تمر كما هي دون تخزينها في الذاكرة.
+    """
+
+    def __init__(self, app, max_bytes: int = ETAG_MAX_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start_message: Optional[Dict[str, Any]] = None
+        body_parts: List[bytes] = []
+        passthrough = False
+
+        async def send_with_etag(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                if (message["status"] != 200 or "etag" in headers or length is None
+                        or int(length) > self.max_bytes
+                        or not headers.get("content-type", "").startswith("application/json")):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            if message.get("more_body", False) and not body_parts:
+                # جسم مبثوث على أجزاء: يُمرر كما هو دون تجميعه
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(body_parts)
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["etag"] = etag
+            if "cache-control" not in headers:
+                headers["cache-control"] = "no-cache"
+            if etag_matches(if_none_match, etag):
+                start_message["status"] = 304
+                del headers["content-length"]
+                body = b""
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_with_etag)
+
+
+app.add_middleware(ETagMiddleware)
+
+# ضغط الاستجابات (brotli عند توفره أو gzip) حسب Accept-Encoding وفوق حد أدنى للحجم
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """اختيار br ثم gzip حسب قيم q في Accept-Encoding"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits=31 ينتج صيغة gzip كاملة (ترويسة وتذييل)
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """ضغط الاستجابات النصية؛ المبثوثة تُضغط دفعة بدفعة دون تجميعها في الذاكرة"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        compressor: Optional[_Compressor] = None
+        start_message: Optional[Dict[str, Any]] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal compressor, start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                content_type = headers.get("content-type", "")
+                # بث الأحداث (SSE) يجب أن يصل فوراً، والضاغط يحتجز البيانات حتى يمتلئ
+                if ("content-encoding" in headers or message["status"] in (204, 206, 304)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or content_type.startswith("text/event-stream")
+                        or (length is not None and int(length) < self.minimum_size)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # التمثيل المضغوط يختلف بايتياً عن الأصلي
+                    headers["etag"] = "W/" + etag
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["content-length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+app.add_middleware(CompressionMiddleware)
+
+# مقاييس بصيغة Prometheus النصية (مجمعة في الذاكرة لكل عامل، دون اعتماديات إضافية)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# كل عامل uvicorn يحتفظ بمقاييسه الخاصة؛ تُوسم كل سلسلة بمعرّف العملية ويجمعها Prometheus (sum by)
+WORKER_ID = str(os.getpid())
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _label_text(names: tuple, values: tuple) -> str:
+    pairs = [f'worker="{WORKER_ID}"']
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labels, labels)} {value}" for labels, value in self.values.items()]
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name, self.help_text, self.labels, self.buckets = name, help_text, labels, buckets
+        # لكل سلسلة: عدادات الحاويات (غير تراكمية) ثم المجموع ثم العدد
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_text(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, labels)} {count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+        self.latency = Histogram("http_request_duration_seconds", "Handler latency", ("method", "route"),
+                                 LATENCY_BUCKETS)
+        self.response_size = Histogram("http_response_size_bytes", "Response body size on the wire", ("route",),
+                                       SIZE_BUCKETS)
+        self.in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+        self.upstream_requests = Counter("upstream_requests_total", "Requests to the external API",
+                                         ("method", "resource", "status"))
+        self.upstream_latency = Histogram("upstream_request_duration_seconds", "External API latency",
+                                          ("method", "resource"), LATENCY_BUCKETS)
+        self.upstream_errors = Counter("upstream_errors_total", "Failed or rejected external API requests",
+                                       ("method", "resource", "error"))
+        self._in_flight = 0
+
+    def observe_upstream(self, method: str, resource: str, status: Optional[int], duration: float,
+                         error: Optional[str]):
+        if status is not None:
+            self.upstream_requests.inc((method, resource, str(status)))
+            self.upstream_latency.observe((method, resource), duration)
+        if error is not None or (status is not None and status >= 500):
+            self.upstream_errors.inc((method, resource, error or f"http_{status}"))
+
+    def render(self, client: "APIClient") -> str:
+        self.in_flight.set((), self._in_flight)
+        lines: List[str] = []
+        for metric in (self.requests, self.latency, self.response_size, self.in_flight,
+                       self.upstream_requests, self.upstream_latency, self.upstream_errors):
+            lines += metric.render()
+        cache = client.cache.stats()
+        worker = _label_text((), ())
+        lines += ["# HELP cache_lookups_total Response cache lookups by result", "# TYPE cache_lookups_total counter"]
+        for result in ("hits", "stale_hits", "misses"):
+            lines.append(f'cache_lookups_total{_label_text(("result",), (result,))} {cache[result]}')
+        lines += ["# HELP cache_hit_ratio Fresh and stale hits over all lookups", "# TYPE cache_hit_ratio gauge",
+                  f"cache_hit_ratio{worker} {cache['hit_ratio']}",
+                  "# HELP cache_bytes Bytes held by the response cache", "# TYPE cache_bytes gauge",
+                  f"cache_bytes{worker} {cache['bytes']}",
+                  "# HELP upstream_concurrency_limit Adaptive concurrency limit", "# TYPE upstream_concurrency_limit gauge",
+                  f"upstream_concurrency_limit{worker} {client.limiter.stats()['limit']}",
+                  "# HELP upstream_circuit_open Circuit breaker open (1) or not (0)", "# TYPE upstream_circuit_open gauge"]
+        for resource, breaker in client.breakers.items():
+            lines.append(f'upstream_circuit_open{_label_text(("resource",), (resource,))} {int(breaker.is_open())}')
+        lines += ["# HELP upstream_retries_total GET retries after transient upstream errors",
+                  "# TYPE upstream_retries_total counter", f"upstream_retries_total{worker} {client.retries}",
+                  "# HELP upstream_hedges_total Hedged GET requests sent", "# TYPE upstream_hedges_total counter",
+                  f"upstream_hedges_total{worker} {client.hedges}",
+                  "# HELP upstream_hedge_wins_total Hedged requests that answered first",
+                  "# TYPE upstream_hedge_wins_total counter", f"upstream_hedge_wins_total{worker} {client.hedge_wins}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """قياس كل طلب حسب قالب المسار (وليس المسار الفعلي) لإبقاء عدد السلاسل محدوداً"""
+
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        registry = self.registry
+        state = {"status": 500, "size": 0}
+
+        async def send_measured(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        registry._in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            registry._in_flight -= 1
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            registry.requests.inc((method, route_path, str(state["status"])))
+            registry.latency.observe((method, route_path), time.perf_counter() - started)
+            registry.response_size.observe((route_path,), state["size"])
+
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# التحليل الاختياري: بترويسة X-Profile أو بنسبة عيّنات، مع Server-Timing وسجل لأبطأ الطلبات
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_LOG_SIZE = int(os.getenv("PROFILE_SLOW_LOG_SIZE", "50"))
+# يحمي مسارات /admin/profile؛ إن لم يُضبط تبقى معطلة. إن ضُبط يجب أن تساويه ترويسة X-Profile
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+
+class RequestProfiler:
+    """قرار تحليل كل طلب، وحفظ أبطأ N طلب محلَّل"""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, slow_log_size: int = PROFILE_SLOW_LOG_SIZE):
+        self.sample_rate = sample_rate
+        self.slow_log_size = slow_log_size
+        self._slowest: List[tuple] = []
+        self._sequence = 0
+
+    def should_profile(self, header: Optional[str]) -> bool:
+        if header:
+            return header == PROFILE_ADMIN_TOKEN if PROFILE_ADMIN_TOKEN else header not in ("0", "false")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def phases(timings: Dict[str, float], total: float) -> Dict[str, float]:
+        """المراحل بالمللي ثانية؛ decode يُقاس دائماً داخل upstream فيُطرح منه، وapp ما تبقى من الزمن الكلي"""
+        decode = timings.get("decode", 0.0)
+        upstream = max(timings.get("upstream", 0.0) - decode, 0.0)
+        serialize = timings.get("serialize", 0.0)
+        app_time = max(total - upstream - decode - serialize, 0.0)
+        return {name: round(value * 1000, 3) for name, value in
+                (("upstream", upstream), ("decode", decode), ("serialize", serialize), ("app", app_time),
+                 ("total", total))}
+
+    def record(self, method: str, path: str, status: int, phases: Dict[str, float]):
+        self._sequence += 1
+        item = (phases["total"], self._sequence,
+                {"method": method, "path": path, "status": status, "phases": phases, "at": time.time()})
+        if len(self._slowest) < self.slow_log_size:
+            heapq.heappush(self._slowest, item)
+        elif item[0] > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [item[2] for item in sorted(self._slowest, reverse=True)]
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: RequestProfiler = request_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(Headers(scope=scope).get("x-profile")):
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        state: Dict[str, Any] = {"status": 500, "phases": None}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["phases"] = self.profiler.phases(timings, time.perf_counter() - started)
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("server-timing", ", ".join(
+                    f"{name};dur={value}" for name, value in state["phases"].items()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            phases = state["phases"] or self.profiler.phases(timings, time.perf_counter() - started)
+            self.profiler.record(scope["method"], scope["path"], state["status"], phases)
+
+
+app.add_middleware(ProfilingMiddleware)
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> Dict[str, int]:
+    """محلل بالعيّنات: قراءة مكدس خيط حلقة الأحداث دورياً من خيط آخر وتجميعه بصيغة collapsed"""
+    counts: Dict[str, int] = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            key = ";".join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return counts
+
 # تقديم الملفات الثابتة
 #app.mount("/assets", StaticFiles(directory="../frontend/academy-frontend/src/assets"), name="assets")
 # تمكين التقديم الثابت بشكل آمن فقط إذا كان المسار موجودًا (ويمكن ضبطه عبر المتغير البيئي ASSETS_DIR)
@@ -25,60 +565,1815 @@ _assets_dir = os.getenv("ASSETS_DIR", _default_assets_dir)
 if os.path.isdir(_assets_dir):
     app.mount("/assets", StaticFiles(directory=_assets_dir), name="assets")
 
-# عنوان API الخارجي
-EXTERNAL_API_BASE = "http://95.216.63.80:255/api"
+# عنوان API الخارجي (يمكن تغييره عبر المتغير البيئي، مثلاً لتوجيهه إلى خادم وهمي عند القياس)
+EXTERNAL_API_BASE = os.getenv("EXTERNAL_API_BASE", "http://95.216.63.80:255/api")
+
+# إعدادات اتصال API الخارجي (عميل واحد مشترك مع تجميع الاتصالات)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+# تمرير جسم الاستجابة من API الخارجي إلى العميل على دفعات دون بناء كائنات Python للجداول الكبيرة
+STREAM_PASSTHROUGH = os.getenv("STREAM_PASSTHROUGH", "false").lower() == "true"
+
+
+# إعدادات التخزين المؤقت لاستجابات GET
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# المدة الإضافية (بالثواني) التي تُقدَّم فيها القيمة القديمة بينما يتم تحديثها في الخلفية
+CACHE_STALE_SECONDS = float(os.getenv("CACHE_STALE_SECONDS", "300"))
+
+# مدة الصلاحية (بالثواني) لكل نقطة نهاية في API الخارجي؛ ما لم يُذكر هنا لا يُخزَّن
+CACHE_TTLS: Dict[str, float] = {
+    "CountryCode": 24 * 3600,
+    "GovernorateCode": 24 * 3600,
+    "CityCode": 24 * 3600,
+    "AcademyClaseType": 3600,
+    "AcademyClaseMaster": 3600,
+    "AcademyData": 3600,
+    "BranchData": 3600,
+    "ComplaintsType": 600,
+    "ComplaintsType/*": 600,
+    "ComplaintsStatus": 600,
+    "ComplaintsStatus/*": 600,
+    "ComplaintsStudent": 120,
+    "ComplaintsStudent/*": 120,
+    # الجداول الكبيرة: مدة قصيرة تكفي لتقديم الصفحات المتتالية من نسخة واحدة مفهرسة
+    "StudentData": 60,
+    "StudentAttend": 60,
+    "StudentEvaluation": 60,
+    "QuestionBankDetail": 600,
+    "ProgramsContentDetail": 600,
+    "Chat": 5,
+    # مصادر فهرس البحث
+    "AcademyClaseDetail": 300,
+    "ProgramsContentMaster": 600,
+    "TeacherData": 300,
+    "QuestionBankMaster": 600,
+    # جداول الربط الرئيسي/التفصيلي
+    "ProjectsMaster": 600,
+    "ProjectsDetail": 600,
+}
+
+# مهلة التقديم القديم لكل نقطة نهاية متغيرة باستمرار بدل CACHE_STALE_SECONDS العامة:
+# الدردشة لا تُقدَّم قديمة أبداً، وبيانات الطلاب والشكاوى لا تتجاوز ضعف مدة صلاحيتها
+CACHE_STALE_WINDOWS: Dict[str, float] = {
+    "Chat": 0,
+    "ComplaintsStudent": 120,
+    "ComplaintsStudent/*": 120,
+    "StudentData": 60,
+    "StudentAttend": 60,
+    "StudentEvaluation": 60,
+}
+
+# تفعيل الكتابة المباشرة في الذاكرة المؤقتة: تخزين الكيان العائد من POST/PUT بدل انتظار قراءته
+CACHE_WRITE_THROUGH = os.getenv("CACHE_WRITE_THROUGH", "false").lower() == "true"
+
+# ما تُبطله كل عملية كتابة من نقاط نهاية API الخارجي، مع مكان الكيان العائد للكتابة المباشرة.
+# تُعبَّأ الأقواس من معاملات المسار ومن حقول الكيان العائد.
+CACHE_WRITE_RULES: Dict[str, Dict[str, Any]] = {
+    "create_complaint": {
+        "invalidate": ["ComplaintsStudent", "ComplaintsStudent/student/*", "ComplaintsStudent/status/*",
+                       "ComplaintsStudent/count/*", "ComplaintsStudent/range"],
+        "entity": "ComplaintsStudent/{id}",
+    },
+    "update_complaint": {
+        "invalidate": ["ComplaintsStudent", "ComplaintsStudent/{complaint_id}", "ComplaintsStudent/{complaint_id}/*",
+                       "ComplaintsStudent/student/*", "ComplaintsStudent/status/*",
+                       "ComplaintsStudent/count/*", "ComplaintsStudent/range"],
+        "entity": "ComplaintsStudent/{complaint_id}",
+    },
+    "delete_complaint": {
+        "invalidate": ["ComplaintsStudent", "ComplaintsStudent/{complaint_id}", "ComplaintsStudent/{complaint_id}/*",
+                       "ComplaintsStudent/student/*", "ComplaintsStudent/status/*",
+                       "ComplaintsStudent/count/*", "ComplaintsStudent/range"],
+    },
+    "create_complaint_type": {
+        "invalidate": ["ComplaintsType", "ComplaintsType/company/*", "ComplaintsType/branch/*", "ComplaintsType/exists"],
+        "entity": "ComplaintsType/{id}",
+    },
+    "update_complaint_type": {
+        "invalidate": ["ComplaintsType", "ComplaintsType/{type_id}", "ComplaintsType/company/*",
+                       "ComplaintsType/branch/*", "ComplaintsType/exists"],
+        "entity": "ComplaintsType/{type_id}",
+    },
+    "delete_complaint_type": {
+        "invalidate": ["ComplaintsType", "ComplaintsType/{type_id}", "ComplaintsType/company/*",
+                       "ComplaintsType/branch/*", "ComplaintsType/exists"],
+    },
+    "create_complaint_status": {
+        "invalidate": ["ComplaintsStatus"],
+        "entity": "ComplaintsStatus/{id}",
+    },
+    "update_complaint_status": {
+        "invalidate": ["ComplaintsStatus", "ComplaintsStatus/{status_id}"],
+        "entity": "ComplaintsStatus/{status_id}",
+    },
+    "delete_complaint_status": {
+        "invalidate": ["ComplaintsStatus", "ComplaintsStatus/{status_id}",
+                       "ComplaintsStudent/status/{status_id}", "ComplaintsStudent/count/{status_id}"],
+    },
+}
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "stored_at", "ttl", "stale", "etag", "last_modified")
+
+    def __init__(self, value: Any, size: int, ttl: float, stale: float,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.value = value
+        self.size = size
+        self.stored_at = time.monotonic()
+        self.ttl = ttl
+        # المدة بعد انتهاء الصلاحية التي يُقدَّم فيها العنصر بينما يُحدَّث في الخلفية
+        self.stale = stale
+        # محددات API الخارجي لإعادة التحقق بطلب شرطي بدل التنزيل الكامل
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def renew(self):
+        self.stored_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.ttl
+
+
+class ResponseCache:
+    """ذاكرة مؤقتة LRU محدودة بعدد العناصر والحجم بالبايت مع صلاحية لكل نقطة نهاية"""
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES, stale_seconds: float = CACHE_STALE_SECONDS,
+                 stale_windows: Optional[Dict[str, float]] = None):
+        self.ttls = ttls
+        self.stale_windows = CACHE_STALE_WINDOWS if stale_windows is None else stale_windows
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        # يزداد مع كل إبطال حتى لا يُخزَّن رد طلب بدأ قبل عملية الكتابة
+        self.generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _match(table: Dict[str, float], endpoint: str) -> Optional[float]:
+        """مطابقة تامة أولاً ثم الأنماط مثل ComplaintsStudent/*"""
+        if endpoint in table:
+            return table[endpoint]
+        for pattern, value in table.items():
+            if "*" in pattern and fnmatch.fnmatchcase(endpoint, pattern):
+                return value
+        return None
+
+    def ttl_for(self, endpoint: str) -> Optional[float]:
+        """مدة صلاحية نقطة النهاية، أو None إذا كانت لا تُخزَّن"""
+        return self._match(self.ttls, endpoint)
+
+    def stale_for(self, endpoint: str) -> float:
+        stale = self._match(self.stale_windows, endpoint)
+        return self.stale_seconds if stale is None else stale
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict] = None) -> tuple:
+        return (endpoint, tuple(sorted((params or {}).items())))
+
+    def lookup(self, key: tuple) -> Optional[CacheEntry]:
+        """إرجاع العنصر إن كان صالحاً أو ضمن مهلة التقديم القديم، وتحديث العدادات"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.is_fresh():
+            self.hits += 1
+        elif entry.age() < entry.ttl + entry.stale:
+            self.stale_hits += 1
+        else:
+            # يبقى العنصر المنتهي حتى يُستبدل أو يُزاح، ليُستخدم كآخر قيمة معروفة عند تعطل API الخارجي
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key: tuple, value: Any, size: int, ttl: float,
+              etag: Optional[str] = None, last_modified: Optional[str] = None):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(value, size, ttl, self.stale_for(key[0]), etag, last_modified)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def peek(self, key: tuple) -> Optional[CacheEntry]:
+        """قراءة العنصر دون تحديث العدادات أو ترتيب LRU"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.age() < entry.ttl + entry.stale:
+            return entry
+        return None
+
+    def last_known(self, key: tuple) -> Optional[CacheEntry]:
+        """آخر قيمة مخزنة بغض النظر عن عمرها"""
+        return self._entries.get(key)
+
+    def invalidate(self, patterns: List[str]) -> int:
+        """حذف كل العناصر التي تطابق نقطة نهايتها أحد الأنماط وإرجاع عددها"""
+        self.generation += 1
+        keys = [key for key in self._entries
+                if any(fnmatch.fnmatchcase(key[0], pattern) for pattern in patterns)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+        self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+# قاطع الدائرة لكل مورد في API الخارجي
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# محدد التزامن التكيفي (AIMD) لكل الطلبات إلى API الخارجي
+UPSTREAM_CONCURRENCY_INITIAL = int(os.getenv("UPSTREAM_CONCURRENCY_INITIAL", "20"))
+UPSTREAM_CONCURRENCY_MIN = int(os.getenv("UPSTREAM_CONCURRENCY_MIN", "2"))
+UPSTREAM_CONCURRENCY_MAX = int(os.getenv("UPSTREAM_CONCURRENCY_MAX", str(UPSTREAM_MAX_CONNECTIONS)))
+UPSTREAM_LATENCY_TARGET = float(os.getenv("UPSTREAM_LATENCY_TARGET", "2"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))
+
+
+class CircuitBreaker:
+    """قاطع دائرة بثلاث حالات: مغلق، مفتوح (رفض فوري)، نصف مفتوح (طلبات تجريبية محدودة)"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS, half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, ok: Optional[bool]):
+        """تسجيل نتيجة الطلب؛ None تعني نتيجة محايدة (مثل الإلغاء) تحرر الطلب التجريبي فقط"""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+        if ok is None:
+            return
+        if ok:
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+
+class AdaptiveLimiter:
+    """حد تزامن يزداد بمقدار ثابت مع النجاح وينخفض بالنصف عند الأخطاء أو البطء (AIMD)"""
+
+    def __init__(self, initial: int = UPSTREAM_CONCURRENCY_INITIAL, minimum: int = UPSTREAM_CONCURRENCY_MIN,
+                 maximum: int = UPSTREAM_CONCURRENCY_MAX, latency_target: float = UPSTREAM_LATENCY_TARGET,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.rejected = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # سُلِّم المكان في اللحظة نفسها: إعادته لمن بعدنا
+                self.inflight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="External API overloaded: concurrency limit reached")
+            raise
+
+    def release(self, latency: float, ok: Optional[bool]):
+        self.inflight -= 1
+        if ok is False or (ok and latency > self.latency_target):
+            now = time.monotonic()
+            # خفض واحد لكل نافذة حتى لا تنهار القيمة بسبب دفعة أخطاء متزامنة
+            if now - self._last_decrease >= min(self.latency_target, 1.0):
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+        elif ok:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": int(self.limit), "inflight": self.inflight, "queued": len(self._waiters),
+                "rejected": self.rejected}
+
+
+# آخر نسخة سليمة من قوائم API الخارجي لتقديمها عند تعطله (في الذاكرة مع لقطة اختيارية على القرص)
+LKG_ENDPOINTS = os.getenv(
+    "LKG_ENDPOINTS",
+    "AcademyClaseDetail,AcademyClaseMaster,AcademyClaseType,AcademyData,AcademyJob,BranchData,"
+    "ProgramsContentMaster,ProgramsContentDetail,ProjectsMaster,ProjectsDetail,SkillDevelopment,"
+    "QuestionBankMaster,ComplaintsType,CountryCode,GovernorateCode,CityCode,StudentGroup",
+).split(",")
+LKG_SNAPSHOT_PATH = os.getenv("LKG_SNAPSHOT_PATH", "")
+LKG_SNAPSHOT_INTERVAL = float(os.getenv("LKG_SNAPSHOT_INTERVAL", "60"))
+
+
+class LastKnownGoodStore:
+    """آخر استجابة ناجحة لكل نقطة نهاية قائمة، مع حفظها دورياً على القرص وتحميلها عند البدء"""
+
+    def __init__(self, endpoints: List[str], snapshot_path: str = "", interval: float = LKG_SNAPSHOT_INTERVAL):
+        self.endpoints = {endpoint.strip() for endpoint in endpoints if endpoint.strip()}
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self._values: Dict[str, tuple] = {}
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def remember(self, endpoint: str, value: Any):
+        if endpoint in self.endpoints:
+            self._values[endpoint] = (value, time.time())
+            self._dirty = True
+
+    def get(self, endpoint: str) -> Optional[tuple]:
+        """إرجاع (القيمة، العمر بالثواني) أو None"""
+        item = self._values.get(endpoint)
+        if item is None:
+            return None
+        value, stored_at = item
+        return value, time.time() - stored_at
+
+    async def load(self):
+        if not self.snapshot_path:
+            return
+        try:
+            async with aiofiles.open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.loads(await f.read())
+        except (OSError, ValueError):
+            return
+        for endpoint, item in snapshot.items():
+            if endpoint in self.endpoints and endpoint not in self._values:
+                self._values[endpoint] = (item["value"], item["stored_at"])
+
+    async def save(self):
+        if not self.snapshot_path or not self._dirty:
+            return
+        self._dirty = False
+        snapshot = {endpoint: {"value": value, "stored_at": stored_at}
+                    for endpoint, (value, stored_at) in self._values.items()}
+        temporary = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        async with aiofiles.open(temporary, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(snapshot, ensure_ascii=False))
+        await aiofiles.os.replace(temporary, self.snapshot_path)
+
+    async def start(self):
+        """تحميل اللقطة وبدء الحفظ الدوري"""
+        await self.load()
+        if self.snapshot_path and self._task is None:
+            self._task = asyncio.create_task(self._autosave())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.save()
+        except OSError:
+            pass
+
+    async def _autosave(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except OSError:
+                self._dirty = True
+
+
+# ذاكرة مؤقتة مشتركة بين عمّال uvicorn على نفس الجهاز حتى لا يجلب كل عامل نسخته من API الخارجي
+# none: معطلة، memory: ملفات في ذاكرة مشتركة (/dev/shm)، file: ملفات على القرص
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "none").lower()
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "")
+
+
+class SharedCacheStore:
+    """مخزن مشترك قائم على ملفات: ملف لكل مفتاح يحوي سطر ترويسة JSON ثم جسم استجابة API الخارجي كما هو
+
+    الكتابة ذرية (ملف مؤقت ثم replace)، والصلاحية تُحسب بوقت الساعة لأن العمّال عمليات مختلفة.
+    """
+
+    name = "file"
+    # سجل الإبطال يُستبدل بملف فارغ عند تجاوز هذا الحجم
+    LOG_MAX_BYTES = 1024 * 1024
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+        # سجل الإبطال المشترك: كل عامل يقرأ ما أُضيف إليه منذ آخر قراءة ويبطل ذاكرته المحلية
+        self._log_path = os.path.join(directory, "invalidations.log")
+        try:
+            stat = os.stat(self._log_path)
+            self._log_inode, self._log_offset = stat.st_ino, stat.st_size
+        except OSError:
+            self._log_inode, self._log_offset = None, 0
+
+    def _path(self, key: tuple) -> str:
+        endpoint, params = key
+        name = endpoint.replace("%", "%25").replace("/", "%2F")
+        if params:
+            name += "~" + hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.directory, name + ".cache")
+
+    async def _read_file(self, path: str) -> bytes:
+        async with aiofiles.open(path, "rb") as f:
+            return await f.read()
+
+    async def _write_file(self, path: str, data: bytes):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        async with aiofiles.open(temporary, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(temporary, path)
+
+    async def read(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """إرجاع العنصر الصالح (value, size, remaining, etag, last_modified) أو None"""
+        try:
+            data = await self._read_file(self._path(key))
+            header_line, body = data.split(b"\n", 1)
+            header = json.loads(header_line)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        remaining = header["stored_at"] + header["ttl"] - time.time()
+        if remaining <= 0:
+            self.misses += 1
+            return None
+        try:
+            value = json.loads(body)
+        except ValueError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"value": value, "size": len(body), "remaining": remaining,
+                "etag": header.get("etag"), "last_modified": header.get("last_modified")}
+
+    async def write(self, key: tuple, body: bytes, ttl: float,
+                    etag: Optional[str] = None, last_modified: Optional[str] = None):
+        header = {"stored_at": time.time(), "ttl": ttl, "etag": etag, "last_modified": last_modified}
+        try:
+            await self._write_file(self._path(key), json.dumps(header).encode() + b"\n" + body)
+            self.writes += 1
+        except OSError:
+            pass
+
+    def discard(self, key: tuple):
+        """حذف ملف مفتاح واحد دون تسجيله في سجل الإبطال"""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, patterns: List[str]) -> int:
+        """حذف ملفات المفاتيح التي تطابق نقطة نهايتها أحد الأنماط"""
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith(".cache"):
+                continue
+            endpoint = name[:-len(".cache")].split("~", 1)[0].replace("%2F", "/").replace("%25", "%")
+            if any(fnmatch.fnmatchcase(endpoint, pattern) for pattern in patterns):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        self._append_log(patterns)
+        return removed
+
+    def _append_log(self, patterns: List[str]):
+        line = (json.dumps(patterns, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            with open(self._log_path + ".lock", "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                with open(self._log_path, "ab") as log:
+                    log.write(line)
+                    size = log.tell()
+                    inode = os.fstat(log.fileno()).st_ino
+                if inode == self._log_inode and self._log_offset == size - len(line):
+                    # السطر الأخير هو إبطالنا وقد طُبق محلياً بالفعل
+                    self._log_offset = size
+                if size > self.LOG_MAX_BYTES:
+                    # العمّال يلاحظون تغير الملف فيفرغون ذاكرتهم المحلية كلها
+                    temporary = f"{self._log_path}.{os.getpid()}.tmp"
+                    open(temporary, "wb").close()
+                    os.replace(temporary, self._log_path)
+        except OSError:
+            pass
+
+    def invalidations(self) -> Optional[List[str]]:
+        """الأنماط التي أُبطلت (من أي عامل) منذ آخر استدعاء؛ ["*"] إذا استُبدل السجل، وNone إذا لم يتغير شيء"""
+        try:
+            stat = os.stat(self._log_path)
+        except OSError:
+            return None
+        if stat.st_ino == self._log_inode and stat.st_size == self._log_offset:
+            return None
+        rotated = self._log_inode is not None and (stat.st_ino != self._log_inode or stat.st_size < self._log_offset)
+        if rotated or self._log_inode is None:
+            self._log_inode, self._log_offset = stat.st_ino, 0
+        try:
+            with open(self._log_path, "rb") as log:
+                log.seek(self._log_offset)
+                data = log.read()
+        except OSError:
+            return ["*"] if rotated else None
+        # قد يكون آخر سطر قيد الكتابة؛ يُقرأ في المرة التالية
+        complete = data[:data.rfind(b"\n") + 1]
+        self._log_offset += len(complete)
+        if rotated:
+            return ["*"]
+        patterns: List[str] = []
+        for line in complete.splitlines():
+            try:
+                patterns.extend(json.loads(line))
+            except ValueError:
+                return ["*"]
+        return patterns or None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "directory": self.directory, "hits": self.hits,
+                "misses": self.misses, "writes": self.writes}
+
+
+class SharedMemoryStore(SharedCacheStore):
+    """نفس المخزن في /dev/shm (tmpfs): القراءة والكتابة نسخ في الذاكرة لا تحجب حلقة الأحداث، فتتم مباشرة دون خيوط aiofiles"""
+
+    name = "memory"
+
+    async def _read_file(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _write_file(self, path: str, data: bytes):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+
+def create_shared_store(backend: str = SHARED_CACHE_BACKEND,
+                        directory: str = SHARED_CACHE_DIR) -> Optional[SharedCacheStore]:
+    """إنشاء المخزن المشترك حسب الإعداد؛ memory يرجع إلى file إذا لم تتوفر /dev/shm"""
+    if backend == "memory" and os.path.isdir("/dev/shm"):
+        return SharedMemoryStore(directory or "/dev/shm/academy-cache")
+    if backend in ("memory", "file"):
+        return SharedCacheStore(directory or os.path.join(tempfile.gettempdir(), "academy-cache-shared"))
+    return None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 يحتاج حزمة h2 (httpx[http2]) وهي اختيارية"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# إعادة محاولة طلبات GET مع تأخير أسي متذبذب، ضمن ميزانية تمنع تحول الإعادات إلى عاصفة طلبات
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BASE = float(os.getenv("UPSTREAM_RETRY_BASE", "0.1"))
+UPSTREAM_RETRY_MAX = float(os.getenv("UPSTREAM_RETRY_MAX", "2"))
+# مهلة إجمالية تشمل كل المحاولات والانتظار بينها، فلا تطيل الإعادات انتظار المستخدم عن مهلة طلب واحد
+UPSTREAM_RETRY_DEADLINE = float(os.getenv("UPSTREAM_RETRY_DEADLINE", str(UPSTREAM_READ_TIMEOUT)))
+# كل طلب أصلي يضيف هذه النسبة إلى الميزانية، مع حد أدنى من الإعادات في الثانية عند قلة الحركة
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "5"))
+
+# الطلبات المتحوطة: طلب GET ثانٍ إذا تجاوز الأول زمن النسبة المئوية (p95) للمورد؛ تستهلك من نفس الميزانية
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = 256
+
+
+class RetryBudget:
+    """دلو رموز: الطلبات الأصلية تودع نسبة من رمز، وكل إعادة أو طلب متحوط يسحب رمزاً كاملاً"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        # السعة تكفي عشر ثوانٍ من الحد الأدنى حتى لا تتراكم ميزانية كبيرة في فترات الهدوء
+        self.capacity = max(1.0, min_per_second * 10)
+        self.tokens = self.capacity
+        self.exhausted = 0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+class LatencyTracker:
+    """آخر أزمنة الاستجابة الناجحة لطلبات GET لكل مورد لحساب مهلة التحوط"""
+
+    def __init__(self, quantile: float = HEDGE_QUANTILE, window: int = HEDGE_WINDOW):
+        self.quantile = quantile
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._observed: Dict[str, int] = {}
+        # المورد -> (عدد العينات عند الحساب، المهلة)
+        self._delays: Dict[str, tuple] = {}
+
+    def observe(self, method: str, resource: str, status: Optional[int], duration: float, error: Optional[str]):
+        """يُسجَّل كخطاف في APIClient.hooks"""
+        if method != "GET" or error is not None or status is None or status >= 400:
+            return
+        samples = self._samples.get(resource)
+        if samples is None:
+            samples = self._samples[resource] = deque(maxlen=self.window)
+        samples.append(duration)
+        self._observed[resource] = self._observed.get(resource, 0) + 1
+
+    def hedge_delay(self, resource: str) -> Optional[float]:
+        samples = self._samples.get(resource)
+        if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        observed = self._observed[resource]
+        cached = self._delays.get(resource)
+        # إعادة الحساب كل 16 عينة جديدة تكفي؛ الفرز مع كل طلب مكلف
+        if cached is None or observed - cached[0] >= 16:
+            ordered = sorted(samples)
+            cached = (observed, max(HEDGE_MIN_DELAY, ordered[int(self.quantile * (len(ordered) - 1))]))
+            self._delays[resource] = cached
+        return cached[1]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """أخطاء عابرة تستحق إعادة المحاولة: انقطاع الاتصال أو انتهاء المهلة، أو رد 5xx أو 429 من API الخارجي"""
+    cause = error.__cause__
+    if isinstance(cause, httpx.TransportError):
+        return True
+    if isinstance(cause, httpx.HTTPStatusError):
+        return cause.response.status_code >= 500 or cause.response.status_code == 429
+    return False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """تأخير أسي مع تذبذب كامل (full jitter) قبل المحاولة رقم attempt (تبدأ من 1)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
 
 class APIClient:
     def __init__(self):
         self.base_url = EXTERNAL_API_BASE
-        self.timeout = 30.0
-    
-    async def get(self, endpoint: str, params: Optional[Dict] = None):
-        """إجراء طلب GET إلى API الخارجي"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        self.timeout = httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            read=UPSTREAM_READ_TIMEOUT,
+        )
+        self.limits = httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = UPSTREAM_HTTP2 and _http2_available()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.cache = ResponseCache(CACHE_TTLS if CACHE_ENABLED else {})
+        self._refreshing: Dict[tuple, asyncio.Task] = {}
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.limiter = AdaptiveLimiter()
+        self.last_known_good = LastKnownGoodStore(LKG_ENDPOINTS, LKG_SNAPSHOT_PATH)
+        self.shared = create_shared_store() if CACHE_ENABLED else None
+        # دوال تُستدعى بعد كل طلب إلى API الخارجي: (method, resource, status, duration, error)
+        self.hooks: List[Any] = []
+        self.retry_budget = RetryBudget()
+        self.latency = LatencyTracker()
+        self.hooks.append(self.latency.observe)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def start(self):
+        """إنشاء العميل المشترك (يُستدعى عند بدء التطبيق)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+
+    async def close(self):
+        """إغلاق العميل المشترك وتحرير الاتصالات (يُستدعى عند إيقاف التطبيق)"""
+        for task in list(self._refreshing.values()) + list(self._inflight.values()):
+            task.cancel()
+        self._refreshing.clear()
+        self._inflight.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def breaker_for(self, endpoint: str) -> CircuitBreaker:
+        """قاطع واحد لكل مورد (StudentData/5 و StudentData/7 يشتركان في قاطع StudentData)"""
+        resource = endpoint.split("/", 1)[0]
+        breaker = self.breakers.get(resource)
+        if breaker is None:
+            breaker = self.breakers[resource] = CircuitBreaker()
+        return breaker
+
+    @asynccontextmanager
+    async def _guard(self, endpoint: str, method: str = "GET"):
+        """رفض فوري عند فتح الدائرة، ثم انتظار مكان في محدد التزامن؛ يُرجع قاموساً يُسجَّل فيه ناتج الطلب"""
+        resource = endpoint.split("/", 1)[0]
+        breaker = self.breaker_for(endpoint)
+        if not breaker.allow():
+            self._notify(method, resource, None, 0.0, "circuit_open")
+            raise HTTPException(status_code=503, detail=f"External API circuit open for {resource}")
+        try:
+            await self.limiter.acquire()
+        except BaseException as e:
+            breaker.record(None)
+            if isinstance(e, HTTPException):
+                self._notify(method, resource, None, 0.0, "overloaded")
+            raise
+        outcome: Dict[str, Any] = {"ok": None, "status": None, "error": None}
+        started = time.monotonic()
+        try:
+            yield outcome
+        finally:
+            duration = time.monotonic() - started
+            self.limiter.release(duration, outcome["ok"])
+            breaker.record(outcome["ok"])
+            self._notify(method, resource, outcome["status"], duration, outcome["error"])
+
+    def _notify(self, method: str, resource: str, status: Optional[int], duration: float, error: Optional[str]):
+        for hook in self.hooks:
+            hook(method, resource, status, duration, error)
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """تنفيذ طلب عبر العميل المشترك مع توحيد معالجة الأخطاء"""
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        async with self._guard(endpoint, method) as outcome:
+            try:
+                response = await self._client.request(method, f"/{endpoint}", **kwargs)
+            except httpx.HTTPError as e:
+                outcome["ok"] = False
+                outcome["error"] = type(e).__name__
+                raise HTTPException(status_code=500, detail=f"External API error: {str(e)}") from e
+            # أخطاء 4xx تخص الطلب نفسه ولا تدل على تعطل API الخارجي
+            outcome["ok"] = response.status_code < 500
+            outcome["status"] = response.status_code
+            if response.status_code == 304:
+                return response
             try:
-                response = await client.get(f"{self.base_url}/{endpoint}", params=params)
                 response.raise_for_status()
-                return response.json()
             except httpx.HTTPError as e:
-                raise HTTPException(status_code=500, detail=f"External API error: {str(e)}")
-    
+                raise HTTPException(status_code=500, detail=f"External API error: {str(e)}") from e
+            return response
+
+    async def _get_with_retries(self, endpoint: str, **kwargs) -> httpx.Response:
+        """طلب GET مع إعادة المحاولة عند الأخطاء العابرة ضمن ميزانية الإعادات"""
+        self.retry_budget.deposit()
+        deadline = time.monotonic() + UPSTREAM_RETRY_DEADLINE
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await asyncio.wait_for(self._hedged_get(endpoint, **kwargs), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=500,
+                                    detail=f"External API error: no response within {UPSTREAM_RETRY_DEADLINE:g}s for {endpoint}")
+            except HTTPException as e:
+                delay = backoff_delay(attempt, UPSTREAM_RETRY_BASE, UPSTREAM_RETRY_MAX)
+                # لا فائدة من محاولة لا يبقى لها وقت قبل المهلة الإجمالية
+                if (attempt > UPSTREAM_RETRIES or not is_retryable(e)
+                        or time.monotonic() + delay >= deadline or not self.retry_budget.withdraw()):
+                    raise
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged_get(self, endpoint: str, **kwargs) -> httpx.Response:
+        """إرسال طلب ثانٍ إذا تأخر الأول أكثر من p95 للمورد، واعتماد أول رد ناجح وإلغاء الآخر"""
+        delay = self.latency.hedge_delay(endpoint.split("/", 1)[0]) if HEDGE_ENABLED else None
+        if delay is None:
+            return await self._request("GET", endpoint, **kwargs)
+        first = asyncio.create_task(self._request("GET", endpoint, **kwargs))
+        started = [first]
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.retry_budget.withdraw():
+                self.hedges += 1
+                started.append(asyncio.create_task(self._request("GET", endpoint, **kwargs)))
+                tasks.add(started[-1])
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    # خطأ الطلب الأول أولى بالإبلاغ إذا فشل الطلبان
+                    if error is None or task is first:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    def retry_stats(self) -> Dict[str, Any]:
+        return {"retries": self.retries, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "budget_tokens": round(self.retry_budget.tokens, 2), "budget_exhausted": self.retry_budget.exhausted}
+
+    async def get(self, endpoint: str, params: Optional[Dict] = None):
+        """إجراء طلب GET إلى API الخارجي (مع التخزين المؤقت لنقاط النهاية المرجعية)"""
+        self.sync_invalidations()
+        ttl = self.cache.ttl_for(endpoint)
+        key = self.cache.make_key(endpoint, params)
+        if ttl is not None:
+            entry = self.cache.lookup(key)
+            if entry is not None:
+                if not entry.is_fresh():
+                    self._schedule_refresh(key, endpoint, params, ttl)
+                return entry.value
+        try:
+            # يشمل زمن فك الترميز في المهمة المشتركة كما في post/put/delete؛ يُطرح عند عرض المراحل
+            with profile_phase("upstream"):
+                return await self._fetch_shared(key, endpoint, params, ttl)
+        except HTTPException:
+            # الدائرة مفتوحة: آخر قيمة مخزنة (حتى لو انتهت صلاحيتها) أفضل من الفشل
+            entry = self.cache.last_known(key) if self.breaker_for(endpoint).is_open() else None
+            if entry is None:
+                raise
+            return entry.value
+
+    async def _fetch_shared(self, key: tuple, endpoint: str, params: Optional[Dict], ttl: Optional[float],
+                            force: bool = False):
+        """دمج طلبات GET المتزامنة المتطابقة في طلب واحد إلى API الخارجي (single-flight)
+
+        ينفَّذ الطلب في مهمة مستقلة محمية بـ shield، فإلغاء أحد المنتظرين (انقطاع العميل)
+        لا يلغي الطلب على البقية، ويتلقى الجميع النتيجة نفسها أو الخطأ نفسه.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key, endpoint, params, ttl, force))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._flight_done(key, t))
+        return await asyncio.shield(task)
+
+    def _flight_done(self, key: tuple, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # تعليم الخطأ كمُستلَم حتى لو أُلغي جميع المنتظرين
+            task.exception()
+
+    async def load_shared(self, key: tuple, endpoint: str, params: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+        """نسخ العنصر من المخزن المشترك (إن كان صالحاً) إلى الذاكرة المؤقتة المحلية وإرجاعه"""
+        if self.shared is None:
+            return None
+        generation = self.cache.generation
+        item = await self.shared.read(key)
+        # إبطال من عامل آخر أثناء القراءة: قد يكون الملف المقروء هو القديم
+        self.sync_invalidations()
+        if item is None or generation != self.cache.generation:
+            return None
+        self.cache.store(key, item["value"], item["size"], item["remaining"], item["etag"], item["last_modified"])
+        if not params:
+            self.last_known_good.remember(endpoint, item["value"])
+        return item
+
+    async def _fetch_and_store(self, key: tuple, endpoint: str, params: Optional[Dict], ttl: Optional[float],
+                               force: bool = False):
+        # عامل آخر جلب نفس البيانات حديثاً: لا حاجة لطلب API الخارجي
+        if ttl is not None and not force:
+            item = await self.load_shared(key, endpoint, params)
+            if item is not None:
+                return item["value"]
+        generation = self.cache.generation
+        previous = self.cache.last_known(key) if ttl is not None else None
+        headers = {}
+        if previous is not None and previous.etag:
+            headers["if-none-match"] = previous.etag
+        if previous is not None and previous.last_modified:
+            headers["if-modified-since"] = previous.last_modified
+        response = await self._get_with_retries(endpoint, params=params, headers=headers or None)
+        if response.status_code == 304 and previous is not None:
+            # لم تتغير البيانات في API الخارجي: تجديد العنصر دون تنزيل أو فك ترميز
+            previous.renew()
+            return previous.value
+        with profile_phase("decode"):
+            value = response.json()
+        # كتابات العمّال الآخرين أثناء الطلب تصل عبر سجل الإبطال؛ بعدها لا تُخزَّن الاستجابة في أي مكان
+        self.sync_invalidations()
+        if ttl is not None and generation == self.cache.generation:
+            self.cache.store(key, value, len(response.content), ttl,
+                             response.headers.get("etag"), response.headers.get("last-modified"))
+            if self.shared is not None:
+                await self.shared.write(key, response.content, ttl,
+                                        response.headers.get("etag"), response.headers.get("last-modified"))
+                self.sync_invalidations()
+                if generation != self.cache.generation:
+                    # إبطال وصل أثناء الكتابة: حذف ما كتبناه حتى لا يقرأه عامل آخر
+                    self.shared.discard(key)
+        if not params:
+            self.last_known_good.remember(endpoint, value)
+        return value
+
+    def _invalidate_local(self, patterns: List[str]):
+        self.cache.invalidate(patterns)
+        for key in [key for key in self._inflight
+                    if any(fnmatch.fnmatchcase(key[0], pattern) for pattern in patterns)]:
+            # الطلبات الجارية بدأت قبل الكتابة؛ الطلبات الجديدة لا تنضم إليها
+            del self._inflight[key]
+
+    def invalidate(self, patterns: List[str]):
+        """إبطال الأنماط محلياً وفي المخزن المشترك، وإعلام بقية العمّال عبر سجل الإبطال"""
+        self._invalidate_local(patterns)
+        if self.shared is not None:
+            self.shared.invalidate(patterns)
+
+    def sync_invalidations(self):
+        """تطبيق الإبطالات التي سجلها عمّال آخرون على الذاكرة المحلية"""
+        if self.shared is None:
+            return
+        patterns = self.shared.invalidations()
+        if patterns:
+            self._invalidate_local(patterns)
+
+    def apply_write_rules(self, route: str, entity: Any = None, collect: Optional[List[str]] = None,
+                          **path_params):
+        """إبطال القراءات المتأثرة بعملية كتابة ناجحة حسب CACHE_WRITE_RULES، وتخزين الكيان العائد اختيارياً
+
+        مع collect تُضاف الأنماط إلى القائمة ليبطلها المستدعي مرة واحدة (دون كتابة مباشرة للكيان).
+        """
+        rule = CACHE_WRITE_RULES.get(route)
+        if rule is None:
+            return
+        fields = dict(entity) if isinstance(entity, dict) else {}
+        fields.update({name: str(value) for name, value in path_params.items()})
+        patterns = []
+        for template in rule["invalidate"]:
+            try:
+                patterns.append(template.format(**fields))
+            except KeyError:
+                # معامل غير معروف: إبطال كل ما يطابق النمط
+                patterns.append(template.split("{", 1)[0] + "*")
+        if collect is not None:
+            collect.extend(patterns)
+            return
+        self.invalidate(patterns)
+
+        template = rule.get("entity")
+        if CACHE_WRITE_THROUGH and template and isinstance(entity, dict):
+            try:
+                endpoint = template.format(**fields)
+            except KeyError:
+                return
+            ttl = self.cache.ttl_for(endpoint)
+            if ttl is not None:
+                size = len(json.dumps(entity, ensure_ascii=False).encode("utf-8"))
+                self.cache.store(self.cache.make_key(endpoint), entity, size, ttl)
+
+    async def refresh(self, endpoint: str, params: Optional[Dict] = None):
+        """جلب نقطة النهاية من API الخارجي وتحديث الذاكرة المؤقتة بغض النظر عن صلاحية العنصر الحالي"""
+        key = self.cache.make_key(endpoint, params)
+        return await self._fetch_shared(key, endpoint, params, self.cache.ttl_for(endpoint), force=True)
+
+    def _schedule_refresh(self, key: tuple, endpoint: str, params: Optional[Dict], ttl: float):
+        """تحديث العنصر القديم في الخلفية مرة واحدة فقط لكل مفتاح"""
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                await self._fetch_shared(key, endpoint, params, ttl)
+            except Exception:
+                pass
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
     async def post(self, endpoint: str, data: Optional[Dict] = None):
         """إجراء طلب POST إلى API الخارجي"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.post(f"{self.base_url}/{endpoint}", json=data)
-                response.raise_for_status()
+        with profile_phase("upstream"):
+            response = await self._request("POST", endpoint, json=data)
+            with profile_phase("decode"):
                 return response.json()
-            except httpx.HTTPError as e:
-                raise HTTPException(status_code=500, detail=f"External API error: {str(e)}")
-    
+
     async def put(self, endpoint: str, data: Optional[Dict] = None):
         """إجراء طلب PUT إلى API الخارجي"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.put(f"{self.base_url}/{endpoint}", json=data)
-                response.raise_for_status()
+        with profile_phase("upstream"):
+            response = await self._request("PUT", endpoint, json=data)
+            with profile_phase("decode"):
                 return response.json()
-            except httpx.HTTPError as e:
-                raise HTTPException(status_code=500, detail=f"External API error: {str(e)}")
-    
+
     async def delete(self, endpoint: str):
         """إجراء طلب DELETE إلى API الخارجي"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.delete(f"{self.base_url}/{endpoint}")
-                response.raise_for_status()
+        with profile_phase("upstream"):
+            response = await self._request("DELETE", endpoint)
+            with profile_phase("decode"):
                 return response.json()
+
+    async def open_stream(self, endpoint: str, params: Optional[Dict] = None,
+                          headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """فتح طلب GET دون قراءة الجسم؛ على المستدعي إغلاق الاستجابة بـ aclose()"""
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        # الحماية تغطي انتظار الترويسات فقط؛ بث الجسم لا يحجز مكاناً في محدد التزامن
+        async with self._guard(endpoint) as outcome:
+            try:
+                request = self._client.build_request("GET", f"/{endpoint}", params=params, headers=headers)
+                response = await self._client.send(request, stream=True)
             except httpx.HTTPError as e:
+                outcome["ok"] = False
+                outcome["error"] = type(e).__name__
                 raise HTTPException(status_code=500, detail=f"External API error: {str(e)}")
+            outcome["ok"] = response.status_code < 500
+            outcome["status"] = response.status_code
+        if response.is_error:
+            await response.aclose()
+            raise HTTPException(status_code=500, detail=f"External API error: {response.status_code} for {endpoint}")
+        return response
 
 api_client = APIClient()
+if METRICS_ENABLED:
+    api_client.hooks.append(metrics.observe_upstream)
+
+# تسخين الذاكرة المؤقتة في الخلفية وتحديث البيانات الساخنة دورياً
+WARM_ENABLED = os.getenv("WARM_ENABLED", "true").lower() == "true"
+WARM_ENDPOINTS = os.getenv(
+    "WARM_ENDPOINTS",
+    "AcademyClaseDetail,AcademyClaseMaster,AcademyClaseType,AcademyData,AcademyJob,BranchData,"
+    "ProgramsContentMaster,ProjectsMaster,SkillDevelopment,CountryCode,GovernorateCode,CityCode",
+).split(",")
+WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", "300"))
+WARM_JITTER = float(os.getenv("WARM_JITTER", "0.1"))
+# مدة انتظار العامل غير القائد لنشر القائد قبل أن يجلب البيانات بنفسه
+WARM_FOLLOWER_WAIT = float(os.getenv("WARM_FOLLOWER_WAIT", "15"))
+WARM_FOLLOWER_POLL = 0.25
+# مجلد مشترك بين عمّال uvicorn على نفس الجهاز: قفل العامل القائد والبيانات التي يجلبها
+WARM_SHARED_DIR = os.getenv("WARM_SHARED_DIR", os.path.join(tempfile.gettempdir(), "academy-cache-warm"))
+
+
+class CacheWarmer:
+    """يجلب نقاط النهاية المحددة عند البدء ثم دورياً مع تذبذب عشوائي
+
+    عامل واحد فقط على الجهاز (من يحصل على قفل الملف) يطلبها من API الخارجي وينشرها في
+    المجلد المشترك، وبقية العمّال يحمّلونها من هناك إلى ذاكرتهم المؤقتة.
+    """
+
+    def __init__(self, client: APIClient, endpoints: List[str], interval: float = WARM_INTERVAL,
+                 jitter: float = WARM_JITTER, shared_dir: str = WARM_SHARED_DIR):
+        self.client = client
+        self.endpoints = [endpoint.strip() for endpoint in endpoints if endpoint.strip()]
+        self.interval = interval
+        self.jitter = jitter
+        self.shared_dir = shared_dir
+        self.is_leader = False
+        self._lock_file = None
+        self._loaded: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.endpoints or self._task is not None:
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        for endpoint in self.endpoints:
+            # العنصر المسخَّن يجب أن يبقى صالحاً حتى التحديث التالي
+            self.client.cache.ttls.setdefault(endpoint, self.interval * 2)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.is_leader = False
+
+    def _try_lead(self) -> bool:
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        lock_file = open(os.path.join(self.shared_dir, "leader.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # يبقى الملف مفتوحاً طوال عمر العامل؛ النظام يحرر القفل إذا توقف
+        self._lock_file = lock_file
+        self.is_leader = True
+        return True
+
+    def _shared_path(self, endpoint: str) -> str:
+        return os.path.join(self.shared_dir, endpoint.replace("/", "_") + ".json")
+
+    async def _publish(self, endpoint: str, value: Any):
+        if self.client.shared is not None:
+            # refresh() كتب الاستجابة في المخزن المشترك بالفعل
+            return
+        path = self._shared_path(endpoint)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        async with aiofiles.open(temporary, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(value, ensure_ascii=False))
+        await aiofiles.os.replace(temporary, path)
+
+    async def _load_shared(self, endpoint: str) -> bool:
+        """تحميل ما نشره العامل القائد إن كان أحدث مما حُمِّل وحديثاً بما يكفي"""
+        if self.client.shared is not None:
+            return await self.client.load_shared(self.client.cache.make_key(endpoint), endpoint) is not None
+        path = self._shared_path(endpoint)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            return False
+        if time.time() - modified > self.interval * (1 + self.jitter) * 2:
+            return False
+        if self._loaded.get(endpoint) == modified:
+            return True
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                body = await f.read()
+            value = json.loads(body)
+        except (OSError, ValueError):
+            return False
+        cache = self.client.cache
+        cache.store(cache.make_key(endpoint), value, len(body.encode("utf-8")), cache.ttl_for(endpoint))
+        self.client.last_known_good.remember(endpoint, value)
+        self._loaded[endpoint] = modified
+        return True
+
+    async def _wait_for_leader(self, endpoint: str, deadline: float) -> bool:
+        """انتظار نشر القائد حتى المهلة (عند البدء المتزامن لكل العمّال لم ينشر شيئاً بعد)"""
+        while True:
+            if await self._load_shared(endpoint):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(WARM_FOLLOWER_POLL)
+
+    async def warm_once(self):
+        leader = self._try_lead()
+        deadline = time.monotonic() + WARM_FOLLOWER_WAIT
+        for endpoint in self.endpoints:
+            try:
+                if not leader and await self._wait_for_leader(endpoint, deadline):
+                    continue
+                value = await self.client.refresh(endpoint)
+                if leader:
+                    await self._publish(endpoint, value)
+            except Exception:
+                # فشل نقطة واحدة لا يوقف البقية؛ المحاولة التالية في الدورة القادمة
+                continue
+
+    async def _run(self):
+        while True:
+            await self.warm_once()
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(delay, 1.0))
+
+
+cache_warmer = CacheWarmer(api_client, WARM_ENDPOINTS if WARM_ENABLED and CACHE_ENABLED else [])
+
+# الترقيم والتصفية واختيار الحقول لنقاط النهاية ذات القوائم الكبيرة
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "1000"))
+LIST_RESERVED_PARAMS = {"limit", "offset", "cursor", "fields", "since"}
+
+
+def _index_key(value: Any) -> str:
+    """تمثيل نصي للقيمة يطابق ما يصل في معاملات الاستعلام"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class TableIndex:
+    """فهارس مساواة تُبنى عند أول استخدام لكل حقل فوق نسخة مخزنة من جدول API الخارجي"""
+
+    def __init__(self, rows: List[Any]):
+        self.rows = rows
+        self._fields: Dict[str, Dict[str, List[int]]] = {}
+        self._names: Optional[set] = None
+
+    def known(self, filters: Dict[str, str]) -> Dict[str, str]:
+        """المرشحات على حقول موجودة فعلاً في الصفوف؛ غيرها (مثل _ لكسر التخزين) يُتجاهل"""
+        if self._names is None:
+            self._names = {name for row in self.rows if isinstance(row, dict) for name in row}
+        return {field: value for field, value in filters.items() if field in self._names}
+
+    def positions(self, field: str, value: str) -> List[int]:
+        index = self._fields.get(field)
+        if index is None:
+            index = {}
+            for position, row in enumerate(self.rows):
+                if isinstance(row, dict) and field in row:
+                    index.setdefault(_index_key(row[field]), []).append(position)
+            self._fields[field] = index
+        return index.get(value, [])
+
+    def filter(self, filters: Dict[str, str]) -> List[Any]:
+        if not filters:
+            return self.rows
+        matches = sorted((self.positions(field, value) for field, value in filters.items()), key=len)
+        selected = set(matches[0])
+        for positions in matches[1:]:
+            selected.intersection_update(positions)
+        return [self.rows[position] for position in sorted(selected)]
+
+
+_table_indexes: Dict[str, TableIndex] = {}
+
+
+def table_index(endpoint: str, rows: List[Any]) -> TableIndex:
+    """الفهرس مرتبط بكائن القائمة المخزن؛ يُعاد بناؤه فقط عند تحديث الذاكرة المؤقتة"""
+    index = _table_indexes.get(endpoint)
+    if index is None or index.rows is not rows:
+        index = TableIndex(rows)
+        _table_indexes[endpoint] = index
+    return index
+
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    offset = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    if offset < 0:
+        raise ValueError("negative cursor")
+    return offset
+
+
+class ListQuery:
+    def __init__(self, limit: Optional[int], offset: int, fields: Optional[List[str]], filters: Dict[str, str]):
+        self.limit = limit
+        self.offset = offset
+        self.fields = fields
+        self.filters = filters
+
+    def is_empty(self) -> bool:
+        return self.limit is None and not self.offset and not self.fields and not self.filters
+
+
+def list_query(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> ListQuery:
+    """قراءة limit/offset/cursor وfields، وأي معامل آخر يُعامل كمرشح مساواة إن كان اسم حقل في الجدول"""
+    if cursor:
+        try:
+            offset = _decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    selected = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+    filters = {name: value for name, value in request.query_params.items() if name not in LIST_RESERVED_PARAMS}
+    return ListQuery(limit, offset, selected, filters)
+
+
+def stale_or_error(key: str, endpoint: str, error: Exception, query: Optional[ListQuery] = None) -> Dict[str, Any]:
+    """الرد عند فشل API الخارجي: آخر نسخة سليمة مع عمرها إن وُجدت، وإلا الغلاف الفارغ المعتاد"""
+    snapshot = api_client.last_known_good.get(endpoint)
+    if snapshot is None:
+        return {key: [], "status": "error", "message": str(error)}
+    value, age = snapshot
+    page: Dict[str, Any] = {}
+    if query is not None:
+        value, page = query_table(endpoint, value, query)
+    return {key: value, **page, "status": "success", "stale": True, "age": int(age), "message": str(error)}
+
+
+def use_passthrough(endpoint: str, query: ListQuery) -> bool:
+    """التمرير المباشر فقط للطلب الكامل للجدول وعندما لا توجد نسخة مخزنة أرخص منه"""
+    return (STREAM_PASSTHROUGH and query.is_empty()
+            and api_client.cache.peek(api_client.cache.make_key(endpoint)) is None)
+
+
+async def stream_envelope(key: str, endpoint: str, params: Optional[Dict] = None) -> StreamingResponse:
+    """بث جسم API الخارجي كما هو داخل الغلاف {"<key>": ..., "status": "success"}
+
+    يُفتح الطلب قبل إرجاع الاستجابة، فأخطاء الاتصال أو الحالة تصل إلى المعالج كالمعتاد.
+    """
+    upstream = await api_client.open_stream(endpoint, params)
+
+    async def body():
+        yield b'{"' + key.encode() + b'": '
+        empty = True
+        async for chunk in upstream.aiter_bytes():
+            if chunk:
+                empty = False
+                yield chunk
+        if empty:
+            yield b"null"
+        yield b', "status": "success"}'
+
+    return StreamingResponse(body(), media_type="application/json", background=BackgroundTask(upstream.aclose))
+
+
+def query_table(endpoint: str, rows: Any, query: ListQuery):
+    """تطبيق المرشحات والترقيم واختيار الحقول، وإرجاع الصفوف مع بيانات الصفحة"""
+    if not isinstance(rows, list) or query.is_empty():
+        return rows, {}
+    index = table_index(endpoint, rows)
+    filters = index.known(query.filters)
+    if filters != query.filters:
+        query = ListQuery(query.limit, query.offset, query.fields, filters)
+        if query.is_empty():
+            return rows, {}
+    matched = index.filter(query.filters)
+    end = len(matched) if query.limit is None else query.offset + query.limit
+    page = matched[query.offset:end]
+    if query.fields:
+        page = [{name: row[name] for name in query.fields if name in row} if isinstance(row, dict) else row
+                for row in page]
+    meta: Dict[str, Any] = {"total": len(matched), "offset": query.offset, "limit": query.limit}
+    meta["next_cursor"] = _encode_cursor(end) if end < len(matched) else None
+    return page, meta
+
+
+# المزامنة التدريجية: since=<version> يعيد فقط الصفوف المضافة والمتغيرة والمحذوفة منذ تلك النسخة
+# عدد النسخ السابقة المحفوظة لكل جدول؛ النسخة الأقدم أو غير المعروفة تعني مزامنة كاملة
+SYNC_HISTORY = int(os.getenv("SYNC_HISTORY", "32"))
+
+
+def _row_hash(row: Any) -> str:
+    return hashlib.blake2b(json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+class SyncTracker:
+    """بصمة لكل صف مع رقم التسلسل الذي أُضيف أو تغير فيه، وشواهد للصفوف المحذوفة
+
+    رمز النسخة بصمة لمحتوى الجدول كله، فالعمّال الذين رأوا نفس النسخة يعطون نفس الرمز.
+    """
+
+    def __init__(self, history: int = SYNC_HISTORY):
+        self.history = history
+        self.rows: Optional[List[Any]] = None
+        self.sequence = 0
+        self.version = ""
+        # المفتاح -> [البصمة، تسلسل آخر تغيير، تسلسل الإضافة، الصف]
+        self._entries: Dict[str, list] = {}
+        # المفتاح -> (تسلسل الحذف، المعرّف الأصلي)
+        self._removed: Dict[str, tuple] = {}
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+
+    def update(self, rows: List[Any]):
+        """مقارنة النسخة المخزنة بالسابقة (مرة واحدة لكل كائن قائمة)"""
+        if rows is self.rows:
+            return
+        self.rows = rows
+        sequence = self.sequence + 1
+        changed = False
+        seen = set()
+        for position, row in enumerate(rows):
+            digest = _row_hash(row)
+            row_id = _row_id(row, None)
+            key = _index_key(row_id) if row_id is not None else digest
+            seen.add(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [digest, sequence, sequence, row]
+                self._removed.pop(key, None)
+                changed = True
+            else:
+                if entry[0] != digest:
+                    entry[0], entry[1] = digest, sequence
+                    changed = True
+                entry[3] = row
+        for key in [key for key in self._entries if key not in seen]:
+            row_id = _row_id(self._entries.pop(key)[3], None)
+            self._removed[key] = (sequence, row_id if row_id is not None else key)
+            changed = True
+        if changed or not self.version:
+            self.sequence = sequence
+            digests = sorted(entry[0] for entry in self._entries.values())
+            self.version = hashlib.blake2b("".join(digests).encode(), digest_size=12).hexdigest()
+        self._versions[self.version] = self.sequence
+        self._versions.move_to_end(self.version)
+        while len(self._versions) > self.history:
+            self._versions.popitem(last=False)
+        # الشواهد الأقدم من أقدم نسخة محفوظة لا يطلبها أحد
+        oldest = next(iter(self._versions.values()))
+        self._removed = {key: item for key, item in self._removed.items() if item[0] > oldest}
+
+    def changes(self, since: str) -> Optional[Dict[str, List[Any]]]:
+        """التغييرات منذ النسخة المحددة، أو None إذا لم تكن معروفة"""
+        sequence = self._versions.get(since)
+        if sequence is None:
+            return None
+        added, changed = [], []
+        for _, changed_at, added_at, row in self._entries.values():
+            if added_at > sequence:
+                added.append(row)
+            elif changed_at > sequence:
+                changed.append(row)
+        removed = [row_id for removed_at, row_id in self._removed.values() if removed_at > sequence]
+        return {"added": added, "changed": changed, "removed": removed}
+
+
+_sync_trackers: Dict[str, SyncTracker] = {}
+
+
+def check_sync_query(since: Optional[str], query: ListQuery):
+    """الترقيم لا يتوافق مع رمز نسخة واحد للجدول كله، فيُرفض مع since قبل أي جلب"""
+    if since is not None and (query.limit is not None or query.offset):
+        raise HTTPException(status_code=400, detail="limit/offset/cursor cannot be combined with since")
+
+
+async def sync_table(endpoint: str, since: str, query: ListQuery) -> Dict[str, Any]:
+    """رد وضع المزامنة: التغييرات منذ since، أو كل الصفوف مع full=true إذا كانت النسخة غير معروفة"""
+    rows = await api_client.get(endpoint)
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=500, detail=f"External API error: unexpected payload for {endpoint}")
+    tracker = _sync_trackers.setdefault(endpoint, SyncTracker())
+    tracker.update(rows)
+    delta = tracker.changes(since)
+    full = delta is None
+    if full:
+        delta = {"added": rows, "changed": [], "removed": []}
+    filters = table_index(endpoint, rows).known(query.filters)
+    if filters:
+        # المحذوفات تبقى كاملة: الصف المحذوف لم يعد متاحاً لمطابقته
+        for name in ("added", "changed"):
+            delta[name] = [row for row in delta[name] if isinstance(row, dict) and all(
+                field in row and _index_key(row[field]) == value for field, value in filters.items())]
+    if query.fields:
+        for name in ("added", "changed"):
+            delta[name] = [{field: row[field] for field in query.fields if field in row}
+                           if isinstance(row, dict) else row for row in delta[name]]
+    return {**delta, "version": tracker.version, "full": full, "status": "success"}
+
+
+# الربط الرئيسي/التفصيلي من جهة الخادم عبر فهارس التجزئة على المفتاح الأجنبي
+# العلاقة -> (جدول الرئيسي، جدول التفاصيل، أسماء المفتاح الأجنبي المحتملة في صفوف التفاصيل)
+JOIN_RELATIONS: Dict[str, tuple] = {
+    "course-masters": ("AcademyClaseMaster", "AcademyClaseDetail",
+                       ["academyClaseMasterId", "AcademyClaseMasterId", "classMasterId", "masterId"]),
+    "programs": ("ProgramsContentMaster", "ProgramsContentDetail",
+                 ["programsContentMasterId", "ProgramsContentMasterId", "programId", "masterId"]),
+    "projects": ("ProjectsMaster", "ProjectsDetail",
+                 ["projectsMasterId", "ProjectsMasterId", "projectId", "masterId"]),
+    "question-bank": ("QuestionBankMaster", "QuestionBankDetail",
+                      ["questionBankMasterId", "QuestionBankMasterId", "questionId", "masterId"]),
+}
+ID_FIELDS = ["id", "Id", "ID"]
+
+
+def _first_field(rows: List[Any], candidates: List[str]) -> Optional[str]:
+    """اسم الحقل الموجود فعلاً في صفوف الجدول من بين الأسماء المحتملة"""
+    sample = next((row for row in rows if isinstance(row, dict)), None)
+    if sample is None:
+        return None
+    return next((name for name in candidates if name in sample), None)
+
+
+def _rows_where(endpoint: str, rows: Any, candidates: List[str], value: Any) -> List[Any]:
+    if not isinstance(rows, list):
+        return []
+    field = _first_field(rows, candidates)
+    if field is None:
+        return []
+    index = table_index(endpoint, rows)
+    return [rows[position] for position in index.positions(field, _index_key(value))]
+
+
+async def join_details(relation: str, master_id: Any):
+    """إرجاع (الصف الرئيسي، صفوف التفاصيل التابعة له) من النسخ المخزنة للجدولين"""
+    master_endpoint, detail_endpoint, foreign_keys = JOIN_RELATIONS[relation]
+    masters, details = await asyncio.gather(
+        api_client.get(master_endpoint), api_client.get(detail_endpoint), return_exceptions=True)
+    if isinstance(details, BaseException):
+        snapshot = api_client.last_known_good.get(detail_endpoint)
+        if snapshot is None:
+            raise details
+        details = snapshot[0]
+    master = None
+    if not isinstance(masters, BaseException):
+        matches = _rows_where(master_endpoint, masters, ID_FIELDS, master_id)
+        master = matches[0] if matches else None
+    return master, _rows_where(detail_endpoint, details, foreign_keys, master_id)
+
+
+# بث الملفات الثنائية (صور الدورات ومرفقات الشكاوى) دون فك ترميزها
+COURSE_IMAGE_CACHE_CONTROL = os.getenv("COURSE_IMAGE_CACHE_CONTROL", "public, max-age=86400")
+COMPLAINT_FILE_CACHE_CONTROL = os.getenv("COMPLAINT_FILE_CACHE_CONTROL", "private, max-age=300")
+# ذاكرة مؤقتة على القرص لصور الدورات (تُفعَّل بتحديد المجلد)
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "86400"))
+FILE_CHUNK_SIZE = 64 * 1024
+
+PASSTHROUGH_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+PASSTHROUGH_RESPONSE_HEADERS = ("content-type", "content-length", "content-encoding", "content-range",
+                                "accept-ranges", "etag", "last-modified", "content-disposition")
+
+
+async def stream_binary(endpoint: str, request: Request, cache_control: str) -> StreamingResponse:
+    """تمرير الملف من API الخارجي كما هو مع ترويسات المحتوى والتحقق وطلبات Range"""
+    headers = {name: request.headers[name] for name in PASSTHROUGH_REQUEST_HEADERS if name in request.headers}
+    upstream = await api_client.open_stream(endpoint, headers=headers)
+    response_headers = {name: upstream.headers[name] for name in PASSTHROUGH_RESPONSE_HEADERS
+                        if name in upstream.headers}
+    response_headers["cache-control"] = cache_control
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        background=BackgroundTask(upstream.aclose),
+    )
+
+
+def parse_range(header: Optional[str], size: int):
+    """تحليل ترويسة Range لنطاق واحد؛ None يعني إرسال الملف كاملاً (ومنه الترويسة غير الصالحة نحوياً)،
+    وValueError يعني نطاقاً صحيحاً لا يمكن تلبيته (416)"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if not (start_text or end_text) or not all(text.isdigit() for text in (start_text, end_text) if text):
+        return None
+    if start_text:
+        start = int(start_text)
+        if end_text and int(end_text) < start:
+            return None
+        end = min(int(end_text), size - 1) if end_text else size - 1
+    else:
+        suffix = int(end_text)
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(size - suffix, 0), size - 1
+    if start > end or start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class DiskFileCache:
+    """ذاكرة مؤقتة على القرص للملفات الثنائية مع ملف وصف (النوع، ETag، Last-Modified)"""
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, endpoint: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(endpoint.encode()).hexdigest())
+
+    async def _load(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        path = self._path(endpoint)
+        try:
+            async with aiofiles.open(path + ".json", "r") as f:
+                meta = json.loads(await f.read())
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta["stored_at"] > self.ttl or not os.path.exists(path):
+            return None
+        return meta
+
+    async def _download(self, endpoint: str) -> Dict[str, Any]:
+        path = self._path(endpoint)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        digest = hashlib.sha1()
+        size = 0
+        upstream = await api_client.open_stream(endpoint)
+        try:
+            async with aiofiles.open(temporary, "wb") as f:
+                async for chunk in upstream.aiter_bytes(FILE_CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await f.write(chunk)
+        finally:
+            await upstream.aclose()
+        meta = {
+            "content_type": upstream.headers.get("content-type", "application/octet-stream"),
+            "etag": upstream.headers.get("etag") or f'"{digest.hexdigest()}"',
+            "last_modified": upstream.headers.get("last-modified") or formatdate(usegmt=True),
+            "size": size,
+            "stored_at": time.time(),
+        }
+        await aiofiles.os.replace(temporary, path)
+        async with aiofiles.open(path + ".json", "w") as f:
+            await f.write(json.dumps(meta))
+        return meta
+
+    async def serve(self, endpoint: str, request: Request, cache_control: str) -> Response:
+        """تقديم الملف من القرص، وتنزيله من API الخارجي مرة واحدة عند غيابه أو انتهاء صلاحيته"""
+        meta = await self._load(endpoint)
+        if meta is None:
+            lock = self._locks.setdefault(endpoint, asyncio.Lock())
+            async with lock:
+                meta = await self._load(endpoint) or await self._download(endpoint)
+            self._locks.pop(endpoint, None)
+
+        headers = {
+            "etag": meta["etag"],
+            "last-modified": meta["last_modified"],
+            "cache-control": cache_control,
+            "accept-ranges": "bytes",
+        }
+        if etag_matches(request.headers.get("if-none-match"), meta["etag"]):
+            return Response(status_code=304, headers=headers)
+
+        size = meta["size"]
+        range_header = request.headers.get("range")
+        if request.headers.get("if-range") not in (None, meta["etag"], meta["last_modified"]):
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        start, end = byte_range if byte_range else (0, size - 1)
+        status_code = 206 if byte_range else 200
+        if byte_range:
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1 if size else 0)
+        path = self._path(endpoint)
+
+        async def body():
+            remaining = end - start + 1 if size else 0
+            async with aiofiles.open(path, "rb") as f:
+                await f.seek(start)
+                while remaining > 0:
+                    chunk = await f.read(min(FILE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        return StreamingResponse(body(), status_code=status_code, headers=headers, media_type=meta["content_type"])
+
+
+image_cache = DiskFileCache(IMAGE_CACHE_DIR, IMAGE_CACHE_TTL) if IMAGE_CACHE_DIR else None
+
 
 @app.get("/")
 async def root():
     return {"message": "مرحباً بكم في أكاديمية الإبداع"}
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """إحصائيات الذاكرة المؤقتة لاستجابات API الخارجي"""
+    shared = api_client.shared.stats() if api_client.shared is not None else None
+    return {"cache": api_client.cache.stats(), "shared": shared, "status": "success"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """مقاييس Prometheus للمسارات وAPI الخارجي والذاكرة المؤقتة
+
+    مع تعدد العمّال يجيب عامل واحد فقط عن كل طلب، فالقيم تخص ذلك العامل (الوسم worker)؛
+    تُجمع قيم العمّال في Prometheus بـ sum without (worker).
+    """
+    return Response(metrics.render(api_client), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def require_profile_admin(request: Request):
+    if not PROFILE_ADMIN_TOKEN or request.headers.get("x-admin-token") != PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling admin routes are disabled or token is invalid")
+
+
+@app.get("/admin/profile/slow", dependencies=[Depends(require_profile_admin)])
+async def get_slow_requests():
+    """أبطأ الطلبات المحلَّلة مع توزيع زمنها على المراحل (للعامل الذي أجاب فقط)"""
+    return {"requests": request_profiler.slowest(), "sample_rate": request_profiler.sample_rate,
+            "worker": WORKER_ID, "status": "success"}
+
+@app.post("/admin/profile/config", dependencies=[Depends(require_profile_admin)])
+async def update_profile_config(config_data: dict):
+    """تغيير نسبة العيّنات أو مسح السجل دون إعادة تشغيل: {"sample_rate": 0.05, "reset": true}"""
+    if "sample_rate" in config_data:
+        try:
+            rate = float(config_data["sample_rate"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="sample_rate must be a number")
+        request_profiler.sample_rate = min(max(rate, 0.0), 1.0)
+    if config_data.get("reset"):
+        request_profiler._slowest.clear()
+    return {"sample_rate": request_profiler.sample_rate, "status": "success"}
+
+@app.get("/admin/profile/sample", dependencies=[Depends(require_profile_admin)])
+async def get_profile_sample(seconds: float = Query(5, gt=0, le=60), interval_ms: float = Query(5, ge=1, le=100)):
+    """تفريغ محلل العيّنات لحلقة الأحداث بصيغة collapsed stacks (صالحة لـ flamegraph)"""
+    loop_thread = threading.get_ident()
+    counts = await asyncio.to_thread(sample_stacks, loop_thread, seconds, interval_ms / 1000)
+    lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; charset=utf-8")
+
+@app.get("/upstream/status")
+async def get_upstream_status():
+    """حالة قواطع الدائرة ومحدد التزامن وإعادة المحاولة لـ API الخارجي"""
+    breakers = {resource: {"state": breaker.state, "failures": breaker.failures}
+                for resource, breaker in api_client.breakers.items()}
+    return {"breakers": breakers, "limiter": api_client.limiter.stats(), "retries": api_client.retry_stats(),
+            "status": "success"}
+
 # نقاط النهاية للدورات
 @app.get("/courses")
 async def get_courses():
@@ -87,7 +2382,7 @@ async def get_courses():
         courses = await api_client.get("AcademyClaseDetail")
         return {"courses": courses, "status": "success"}
     except Exception as e:
-        return {"courses": [], "status": "error", "message": str(e)}
+        return stale_or_error("courses", "AcademyClaseDetail", e)
 
 @app.get("/courses/{course_id}")
 async def get_course(course_id: int):
@@ -99,13 +2394,15 @@ async def get_course(course_id: int):
         raise HTTPException(status_code=404, detail=f"Course not found: {str(e)}")
 
 @app.get("/courses/{course_id}/image")
-async def get_course_image(course_id: int):
+async def get_course_image(course_id: int, request: Request):
     """الحصول على صورة الدورة"""
+    endpoint = f"AcademyClaseDetail/{course_id}/image"
     try:
-        image = await api_client.get(f"AcademyClaseDetail/{course_id}/image")
-        return {"image": image, "status": "success"}
+        if image_cache is not None:
+            return await image_cache.serve(endpoint, request, COURSE_IMAGE_CACHE_CONTROL)
+        return await stream_binary(endpoint, request, COURSE_IMAGE_CACHE_CONTROL)
     except Exception as e:
-        return {"image": None, "status": "error", "message": str(e)}
+        return JSONResponse(status_code=502, content={"image": None, "status": "error", "message": str(e)})
 
 # نقاط النهاية للفئات الرئيسية للدورات
 @app.get("/course-masters")
@@ -115,7 +2412,7 @@ async def get_course_masters():
         masters = await api_client.get("AcademyClaseMaster")
         return {"masters": masters, "status": "success"}
     except Exception as e:
-        return {"masters": [], "status": "error", "message": str(e)}
+        return stale_or_error("masters", "AcademyClaseMaster", e)
 
 @app.get("/course-masters/{master_id}")
 async def get_course_master(master_id: int):
@@ -126,6 +2423,15 @@ async def get_course_master(master_id: int):
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Course master not found: {str(e)}")
 
+@app.get("/course-masters/{master_id}/courses")
+async def get_course_master_courses(master_id: int):
+    """الحصول على فئة رئيسية مع دوراتها"""
+    try:
+        master, courses = await join_details("course-masters", master_id)
+        return {"master": master, "courses": courses, "count": len(courses), "status": "success"}
+    except Exception as e:
+        return {"master": None, "courses": [], "status": "error", "message": str(e)}
+
 # نقاط النهاية لأنواع الدورات
 @app.get("/course-types")
 async def get_course_types():
@@ -134,7 +2440,7 @@ async def get_course_types():
         types = await api_client.get("AcademyClaseType")
         return {"types": types, "status": "success"}
     except Exception as e:
-        return {"types": [], "status": "error", "message": str(e)}
+        return stale_or_error("types", "AcademyClaseType", e)
 
 # نقاط النهاية لبيانات الأكاديمية
 @app.get("/academy-data")
@@ -144,7 +2450,7 @@ async def get_academy_data():
         data = await api_client.get("AcademyData")
         return {"data": data, "status": "success"}
     except Exception as e:
-        return {"data": [], "status": "error", "message": str(e)}
+        return stale_or_error("data", "AcademyData", e)
 
 # نقاط النهاية للوظائف
 @app.get("/jobs")
@@ -154,7 +2460,7 @@ async def get_jobs():
         jobs = await api_client.get("AcademyJob")
         return {"jobs": jobs, "status": "success"}
     except Exception as e:
-        return {"jobs": [], "status": "error", "message": str(e)}
+        return stale_or_error("jobs", "AcademyJob", e)
 
 # نقاط النهاية للفروع
 @app.get("/branches")
@@ -164,7 +2470,7 @@ async def get_branches():
         branches = await api_client.get("BranchData")
         return {"branches": branches, "status": "success"}
     except Exception as e:
-        return {"branches": [], "status": "error", "message": str(e)}
+        return stale_or_error("branches", "BranchData", e)
 
 # نقاط النهاية للبرامج
 @app.get("/programs")
@@ -174,7 +2480,7 @@ async def get_programs():
         programs = await api_client.get("ProgramsContentMaster")
         return {"programs": programs, "status": "success"}
     except Exception as e:
-        return {"programs": [], "status": "error", "message": str(e)}
+        return stale_or_error("programs", "ProgramsContentMaster", e)
 
 @app.get("/programs/{program_id}")
 async def get_program(program_id: int):
@@ -185,14 +2491,26 @@ async def get_program(program_id: int):
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Program not found: {str(e)}")
 
+@app.get("/programs/{program_id}/details")
+async def get_program_with_details(program_id: int):
+    """الحصول على برنامج مع تفاصيل محتواه"""
+    try:
+        program, details = await join_details("programs", program_id)
+        return {"program": program, "details": details, "count": len(details), "status": "success"}
+    except Exception as e:
+        return {"program": None, "details": [], "status": "error", "message": str(e)}
+
 @app.get("/program-details")
-async def get_program_details():
+async def get_program_details(query: ListQuery = Depends(list_query)):
     """الحصول على تفاصيل محتوى البرامج"""
     try:
+        if use_passthrough("ProgramsContentDetail", query):
+            return await stream_envelope("details", "ProgramsContentDetail")
         details = await api_client.get("ProgramsContentDetail")
-        return {"details": details, "status": "success"}
+        details, page = query_table("ProgramsContentDetail", details, query)
+        return {"details": details, **page, "status": "success"}
     except Exception as e:
-        return {"details": [], "status": "error", "message": str(e)}
+        return stale_or_error("details", "ProgramsContentDetail", e, query)
 
 # نقاط النهاية للمشاريع
 @app.get("/projects")
@@ -202,7 +2520,7 @@ async def get_projects():
         projects = await api_client.get("ProjectsMaster")
         return {"projects": projects, "status": "success"}
     except Exception as e:
-        return {"projects": [], "status": "error", "message": str(e)}
+        return stale_or_error("projects", "ProjectsMaster", e)
 
 @app.get("/projects/{project_id}")
 async def get_project(project_id: int):
@@ -213,6 +2531,15 @@ async def get_project(project_id: int):
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Project not found: {str(e)}")
 
+@app.get("/projects/{project_id}/details")
+async def get_project_with_details(project_id: int):
+    """الحصول على مشروع مع تفاصيله"""
+    try:
+        project, details = await join_details("projects", project_id)
+        return {"project": project, "details": details, "count": len(details), "status": "success"}
+    except Exception as e:
+        return {"project": None, "details": [], "status": "error", "message": str(e)}
+
 @app.get("/project-details")
 async def get_project_details():
     """الحصول على تفاصيل المشاريع"""
@@ -220,7 +2547,7 @@ async def get_project_details():
         details = await api_client.get("ProjectsDetail")
         return {"details": details, "status": "success"}
     except Exception as e:
-        return {"details": [], "status": "error", "message": str(e)}
+        return stale_or_error("details", "ProjectsDetail", e)
 
 # نقاط النهاية لتطوير المهارات
 @app.get("/skill-development")
@@ -230,15 +2557,21 @@ async def get_skill_development():
         skills = await api_client.get("SkillDevelopment")
         return {"skills": skills, "status": "success"}
     except Exception as e:
-        return {"skills": [], "status": "error", "message": str(e)}
+        return stale_or_error("skills", "SkillDevelopment", e)
 
 # نقاط النهاية للطلاب
 @app.get("/students")
-async def get_students():
+async def get_students(query: ListQuery = Depends(list_query), since: Optional[str] = None):
     """الحصول على بيانات الطلاب"""
+    check_sync_query(since, query)
     try:
+        if since is not None:
+            return await sync_table("StudentData", since, query)
+        if use_passthrough("StudentData", query):
+            return await stream_envelope("students", "StudentData")
         students = await api_client.get("StudentData")
-        return {"students": students, "status": "success"}
+        students, page = query_table("StudentData", students, query)
+        return {"students": students, **page, "status": "success"}
     except Exception as e:
         return {"students": [], "status": "error", "message": str(e)}
 
@@ -278,14 +2611,26 @@ async def get_question_bank():
         questions = await api_client.get("QuestionBankMaster")
         return {"questions": questions, "status": "success"}
     except Exception as e:
-        return {"questions": [], "status": "error", "message": str(e)}
+        return stale_or_error("questions", "QuestionBankMaster", e)
+
+@app.get("/question-bank/{question_id}/details")
+async def get_question_with_details(question_id: int):
+    """الحصول على سؤال من بنك الأسئلة مع تفاصيله"""
+    try:
+        question, details = await join_details("question-bank", question_id)
+        return {"question": question, "details": details, "count": len(details), "status": "success"}
+    except Exception as e:
+        return {"question": None, "details": [], "status": "error", "message": str(e)}
 
 @app.get("/question-details")
-async def get_question_details():
+async def get_question_details(query: ListQuery = Depends(list_query)):
     """الحصول على تفاصيل الأسئلة"""
     try:
+        if use_passthrough("QuestionBankDetail", query):
+            return await stream_envelope("details", "QuestionBankDetail")
         details = await api_client.get("QuestionBankDetail")
-        return {"details": details, "status": "success"}
+        details, page = query_table("QuestionBankDetail", details, query)
+        return {"details": details, **page, "status": "success"}
     except Exception as e:
         return {"details": [], "status": "error", "message": str(e)}
 
@@ -299,6 +2644,169 @@ async def get_complaints():
     except Exception as e:
         return {"complaints": [], "status": "error", "message": str(e)}
 
+# إحصائيات الشكاوى المحسوبة مسبقاً: تمرير واحد على نسخة ComplaintsStudent ثم تحديث تدريجي مع كل كتابة
+COMPLAINT_STATS_MAX_AGE = float(os.getenv("COMPLAINT_STATS_MAX_AGE", "300"))
+# أسماء الحقول المحتملة في صفوف الشكاوى (يُستخدم أول اسم موجود)
+COMPLAINT_STATUS_FIELDS = ["complaintsStatusId", "ComplaintsStatusId", "statusId", "status"]
+COMPLAINT_TYPE_FIELDS = ["complaintsTypeId", "ComplaintsTypeId", "typeId", "type"]
+COMPLAINT_BRANCH_FIELDS = ["branchId", "BranchId", "branchDataId", "branch"]
+COMPLAINT_DATE_FIELDS = ["date", "complaintDate", "createdAt", "createdDate", "insertDate"]
+
+
+def _field_value(row: Dict[str, Any], candidates: List[str]) -> Optional[str]:
+    for name in candidates:
+        if name in row and row[name] is not None:
+            return _index_key(row[name])
+    return None
+
+
+class ComplaintStats:
+    """عدّادات الشكاوى لكل يوم (حسب الحالة والنوع والفرع)، ومجاميع أي نطاق زمني تُجمع من الأيام"""
+
+    def __init__(self):
+        self.records: Dict[Any, tuple] = {}
+        self.days: Dict[Optional[str], Dict[str, Any]] = {}
+        self.built_at = 0.0
+        self._pending: Optional[List[tuple]] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._anonymous = 0
+
+    @staticmethod
+    def _record(row: Dict[str, Any], previous: Optional[tuple] = None) -> tuple:
+        """أبعاد الشكوى من الصف؛ التحديث الجزئي يحتفظ بالأبعاد الغائبة عنه من السجل السابق"""
+        values = []
+        for position, fields in enumerate((COMPLAINT_DATE_FIELDS, COMPLAINT_STATUS_FIELDS,
+                                           COMPLAINT_TYPE_FIELDS, COMPLAINT_BRANCH_FIELDS)):
+            if previous is not None and not any(name in row for name in fields):
+                values.append(previous[position])
+                continue
+            value = _field_value(row, fields)
+            if position == 0:
+                value = value[:10] if value and value != "null" else None
+            values.append(value)
+        return tuple(values)
+
+    def _count(self, record: tuple, delta: int):
+        day, status, complaint_type, branch = record
+        bucket = self.days.setdefault(day, {"total": 0, "status": {}, "type": {}, "branch": {}})
+        bucket["total"] += delta
+        for group, value in (("status", status), ("type", complaint_type), ("branch", branch)):
+            if value is not None:
+                counts = bucket[group]
+                counts[value] = counts.get(value, 0) + delta
+                if not counts[value]:
+                    del counts[value]
+        if not bucket["total"]:
+            del self.days[day]
+
+    def _put(self, complaint_id: Any, row: Dict[str, Any]):
+        if complaint_id is None:
+            self._anonymous += 1
+            complaint_id = ("anonymous", self._anonymous)
+        else:
+            complaint_id = _index_key(complaint_id)
+        previous = self.records.pop(complaint_id, None)
+        if previous is not None:
+            self._count(previous, -1)
+        record = self._record(row, previous)
+        self.records[complaint_id] = record
+        self._count(record, 1)
+
+    def _delete(self, complaint_id: Any):
+        previous = self.records.pop(_index_key(complaint_id), None)
+        if previous is not None:
+            self._count(previous, -1)
+
+    def rebuild(self, rows: Any):
+        self.records = {}
+        self.days = {}
+        if isinstance(rows, list):
+            for row in rows:
+                if isinstance(row, dict):
+                    self._put(_row_id(row, None), row)
+        self.built_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return not self.built_at or time.monotonic() - self.built_at > COMPLAINT_STATS_MAX_AGE
+
+    async def refresh(self, client: APIClient):
+        """إعادة البناء مرة واحدة فقط في كل وقت؛ الطلبات المتزامنة تنتظر نفس إعادة البناء"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._rebuild_from(client))
+            self._refreshing.add_done_callback(self._refresh_done)
+        await asyncio.shield(self._refreshing)
+
+    def _refresh_done(self, task: asyncio.Task):
+        if self._refreshing is task:
+            self._refreshing = None
+        if not task.cancelled():
+            task.exception()
+
+    async def _rebuild_from(self, client: APIClient):
+        """إعادة البناء من API الخارجي ثم إعادة تطبيق الكتابات التي حدثت أثناء الجلب"""
+        pending: List[tuple] = []
+        self._pending = pending
+        try:
+            rows = await client.get("ComplaintsStudent")
+            self.rebuild(rows)
+            for action, complaint_id, row in pending:
+                self._apply(action, complaint_id, row)
+        finally:
+            self._pending = None
+
+    def _apply(self, action: str, complaint_id: Any, row: Optional[Dict[str, Any]]):
+        if action == "delete":
+            self._delete(complaint_id)
+        elif isinstance(row, dict):
+            self._put(complaint_id, row)
+
+    def record_write(self, action: str, complaint_id: Any = None, row: Any = None):
+        """تطبيق عملية كتابة ناجحة على العدادات (create/update/delete)"""
+        if not self.built_at:
+            return
+        if complaint_id is None and isinstance(row, dict):
+            complaint_id = _row_id(row, None)
+        if self._pending is not None:
+            self._pending.append((action, complaint_id, row))
+        self._apply(action, complaint_id, row)
+
+    def summary(self, from_date: Optional[str] = None, to_date: Optional[str] = None) -> Dict[str, Any]:
+        totals: Dict[str, Dict[str, int]] = {"status": {}, "type": {}, "branch": {}}
+        by_day: Dict[str, int] = {}
+        total = 0
+        ranged = bool(from_date or to_date)
+        for day, bucket in self.days.items():
+            if ranged and (day is None or (from_date and day < from_date[:10]) or (to_date and day > to_date[:10])):
+                continue
+            total += bucket["total"]
+            if day is not None:
+                by_day[day] = bucket["total"]
+            for group, counts in totals.items():
+                for value, count in bucket[group].items():
+                    counts[value] = counts.get(value, 0) + count
+        return {
+            "total": total,
+            "by_status": totals["status"],
+            "by_type": totals["type"],
+            "by_branch": totals["branch"],
+            "by_day": dict(sorted(by_day.items())),
+        }
+
+
+complaint_stats = ComplaintStats()
+
+
+@app.get("/complaints/stats")
+async def get_complaint_stats(from_date: Optional[str] = None, to_date: Optional[str] = None):
+    """إحصائيات الشكاوى حسب الحالة والنوع والفرع واليوم، مع نطاق زمني اختياري (YYYY-MM-DD)"""
+    try:
+        if complaint_stats.is_stale():
+            await complaint_stats.refresh(api_client)
+        return {"stats": complaint_stats.summary(from_date, to_date), "from": from_date, "to": to_date,
+                "status": "success"}
+    except Exception as e:
+        return {"stats": None, "status": "error", "message": str(e)}
+
 @app.get("/complaints/{complaint_id}")
 async def get_complaint(complaint_id: str):
     """الحصول على شكوى محددة"""
@@ -313,6 +2821,8 @@ async def create_complaint(complaint_data: dict):
     """إنشاء شكوى جديدة"""
     try:
         complaint = await api_client.post("ComplaintsStudent", complaint_data)
+        api_client.apply_write_rules("create_complaint", complaint)
+        complaint_stats.record_write("create", row=complaint if isinstance(complaint, dict) else complaint_data)
         return {"complaint": complaint, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create complaint: {str(e)}")
@@ -322,6 +2832,8 @@ async def update_complaint(complaint_id: str, complaint_data: dict):
     """تحديث شكوى موجودة"""
     try:
         complaint = await api_client.put(f"ComplaintsStudent/{complaint_id}", complaint_data)
+        api_client.apply_write_rules("update_complaint", complaint, complaint_id=complaint_id)
+        complaint_stats.record_write("update", complaint_id, complaint if isinstance(complaint, dict) else complaint_data)
         return {"complaint": complaint, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to update complaint: {str(e)}")
@@ -331,10 +2843,92 @@ async def delete_complaint(complaint_id: str):
     """حذف شكوى"""
     try:
         result = await api_client.delete(f"ComplaintsStudent/{complaint_id}")
+        api_client.apply_write_rules("delete_complaint", complaint_id=complaint_id)
+        complaint_stats.record_write("delete", complaint_id)
         return {"message": "Complaint deleted successfully", "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to delete complaint: {str(e)}")
 
+# الكتابة الجماعية للشكاوى: تنفيذ متوازٍ محدود مع إعادة محاولة العمليات الآمنة للتكرار
+BULK_MAX_OPERATIONS = int(os.getenv("BULK_MAX_OPERATIONS", "1000"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_RETRIES = int(os.getenv("BULK_RETRIES", "3"))
+BULK_RETRY_BASE = float(os.getenv("BULK_RETRY_BASE", "0.2"))
+BULK_RETRY_MAX = float(os.getenv("BULK_RETRY_MAX", "5"))
+# الإنشاء لا يُعاد: قد يكون API الخارجي نفذ الطلب قبل انقطاع الاتصال فتتكرر الشكوى
+BULK_IDEMPOTENT_OPS = {"update", "delete"}
+
+
+async def _bulk_operation(operation: Any, patterns: List[str]) -> Dict[str, Any]:
+    """تنفيذ عملية واحدة (create/update/delete) وتطبيق الإحصائيات كما في المسارات الفردية
+
+    أنماط الإبطال تُجمع في patterns لتُبطل مرة واحدة بعد انتهاء كل العمليات.
+    """
+    if not isinstance(operation, dict):
+        raise ValueError("Operation must be an object")
+    op = operation.get("op")
+    complaint_id = operation.get("id")
+    data = operation.get("data")
+    if op not in ("create", "update", "delete"):
+        raise ValueError(f"Unknown op: {op}")
+    if op != "create" and complaint_id is None:
+        raise ValueError(f"Missing id for {op}")
+    if op != "delete" and not isinstance(data, dict):
+        raise ValueError(f"Missing data for {op}")
+
+    if op == "create":
+        complaint = await api_client.post("ComplaintsStudent", data)
+        api_client.apply_write_rules("create_complaint", complaint, collect=patterns)
+        complaint_stats.record_write("create", row=complaint if isinstance(complaint, dict) else data)
+        return {"complaint": complaint}
+    if op == "update":
+        complaint = await api_client.put(f"ComplaintsStudent/{complaint_id}", data)
+        api_client.apply_write_rules("update_complaint", complaint, collect=patterns, complaint_id=complaint_id)
+        complaint_stats.record_write("update", complaint_id, complaint if isinstance(complaint, dict) else data)
+        return {"complaint": complaint}
+    await api_client.delete(f"ComplaintsStudent/{complaint_id}")
+    api_client.apply_write_rules("delete_complaint", collect=patterns, complaint_id=complaint_id)
+    complaint_stats.record_write("delete", complaint_id)
+    return {}
+
+
+async def _run_bulk_item(index: int, operation: Any, semaphore: asyncio.Semaphore,
+                         patterns: List[str]) -> Dict[str, Any]:
+    op = operation.get("op") if isinstance(operation, dict) else None
+    retries = BULK_RETRIES if op in BULK_IDEMPOTENT_OPS else 0
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with semaphore:
+                result = await _bulk_operation(operation, patterns)
+            return {"index": index, "op": op, **result, "attempts": attempt, "status": "success"}
+        except Exception as e:
+            if attempt > retries or not is_retryable(e):
+                message = e.detail if isinstance(e, HTTPException) else str(e)
+                return {"index": index, "op": op, "attempts": attempt, "status": "error", "message": message}
+        # الانتظار خارج الحد حتى لا تحجز العملية المتعثرة مكاناً عن غيرها
+        await asyncio.sleep(backoff_delay(attempt, BULK_RETRY_BASE, BULK_RETRY_MAX))
+
+
+@app.post("/complaints/bulk")
+async def bulk_complaints(operations: List[Any]):
+    """تنفيذ مجموعة عمليات على الشكاوى: [{"op": "create", "data": {...}}, {"op": "update", "id": 5, "data": {...}},
+    {"op": "delete", "id": 5}] وإرجاع نتيجة كل عملية بنفس الترتيب"""
+    if len(operations) > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Too many operations: maximum is {BULK_MAX_OPERATIONS}")
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    patterns: List[str] = []
+    try:
+        results = await asyncio.gather(*(_run_bulk_item(index, operation, semaphore, patterns)
+                                         for index, operation in enumerate(operations)))
+    finally:
+        # مسح واحد للذاكرة المؤقتة (والمخزن المشترك) بدل مسح لكل عملية
+        if patterns:
+            api_client.invalidate(list(dict.fromkeys(patterns)))
+    failed = sum(1 for result in results if result["status"] == "error")
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed, "status": "success"}
+
 @app.get("/complaints/student/{student_id}")
 async def get_student_complaints(student_id: str):
     """الحصول على شكاوى طالب محدد"""
@@ -377,13 +2971,12 @@ async def get_complaints_count_by_status(status_id: str):
         return {"count": 0, "status": "error", "message": str(e)}
 
 @app.get("/complaints/{complaint_id}/file")
-async def get_complaint_file(complaint_id: str):
+async def get_complaint_file(complaint_id: str, request: Request):
     """الحصول على ملف الشكوى"""
     try:
-        file = await api_client.get(f"ComplaintsStudent/{complaint_id}/file")
-        return {"file": file, "status": "success"}
+        return await stream_binary(f"ComplaintsStudent/{complaint_id}/file", request, COMPLAINT_FILE_CACHE_CONTROL)
     except Exception as e:
-        return {"file": None, "status": "error", "message": str(e)}
+        return JSONResponse(status_code=502, content={"file": None, "status": "error", "message": str(e)})
 
 # نقاط النهاية لأنواع الشكاوى
 @app.get("/complaint-types")
@@ -393,7 +2986,7 @@ async def get_complaint_types():
         types = await api_client.get("ComplaintsType")
         return {"types": types, "status": "success"}
     except Exception as e:
-        return {"types": [], "status": "error", "message": str(e)}
+        return stale_or_error("types", "ComplaintsType", e)
 
 @app.get("/complaint-types/{type_id}")
 async def get_complaint_type(type_id: str):
@@ -409,6 +3002,7 @@ async def create_complaint_type(type_data: dict):
     """إنشاء نوع شكوى جديد"""
     try:
         complaint_type = await api_client.post("ComplaintsType", type_data)
+        api_client.apply_write_rules("create_complaint_type", complaint_type)
         return {"type": complaint_type, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create complaint type: {str(e)}")
@@ -418,6 +3012,7 @@ async def update_complaint_type(type_id: str, type_data: dict):
     """تحديث نوع شكوى موجود"""
     try:
         complaint_type = await api_client.put(f"ComplaintsType/{type_id}", type_data)
+        api_client.apply_write_rules("update_complaint_type", complaint_type, type_id=type_id)
         return {"type": complaint_type, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to update complaint type: {str(e)}")
@@ -427,6 +3022,7 @@ async def delete_complaint_type(type_id: str):
     """حذف نوع شكوى"""
     try:
         result = await api_client.delete(f"ComplaintsType/{type_id}")
+        api_client.apply_write_rules("delete_complaint_type", type_id=type_id)
         return {"message": "Complaint type deleted successfully", "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to delete complaint type: {str(e)}")
@@ -485,6 +3081,7 @@ async def create_complaint_status(status_data: dict):
     """إنشاء حالة شكوى جديدة"""
     try:
         status = await api_client.post("ComplaintsStatus", status_data)
+        api_client.apply_write_rules("create_complaint_status", status)
         return {"status": status, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create complaint status: {str(e)}")
@@ -494,6 +3091,7 @@ async def update_complaint_status(status_id: str, status_data: dict):
     """تحديث حالة شكوى موجودة"""
     try:
         status = await api_client.put(f"ComplaintsStatus/{status_id}", status_data)
+        api_client.apply_write_rules("update_complaint_status", status, status_id=status_id)
         return {"status": status, "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to update complaint status: {str(e)}")
@@ -503,6 +3101,7 @@ async def delete_complaint_status(status_id: str):
     """حذف حالة شكوى"""
     try:
         result = await api_client.delete(f"ComplaintsStatus/{status_id}")
+        api_client.apply_write_rules("delete_complaint_status", status_id=status_id)
         return {"message": "Complaint status deleted successfully", "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to delete complaint status: {str(e)}")
@@ -515,7 +3114,7 @@ async def get_countries():
         countries = await api_client.get("CountryCode")
         return {"countries": countries, "status": "success"}
     except Exception as e:
-        return {"countries": [], "status": "error", "message": str(e)}
+        return stale_or_error("countries", "CountryCode", e)
 
 @app.get("/governorates")
 async def get_governorates():
@@ -524,7 +3123,7 @@ async def get_governorates():
         governorates = await api_client.get("GovernorateCode")
         return {"governorates": governorates, "status": "success"}
     except Exception as e:
-        return {"governorates": [], "status": "error", "message": str(e)}
+        return stale_or_error("governorates", "GovernorateCode", e)
 
 @app.get("/cities")
 async def get_cities():
@@ -533,24 +3132,36 @@ async def get_cities():
         cities = await api_client.get("CityCode")
         return {"cities": cities, "status": "success"}
     except Exception as e:
-        return {"cities": [], "status": "error", "message": str(e)}
+        return stale_or_error("cities", "CityCode", e)
 
 # نقاط النهاية للحضور والتقييم
 @app.get("/attendance")
-async def get_attendance():
+async def get_attendance(query: ListQuery = Depends(list_query), since: Optional[str] = None):
     """الحصول على بيانات الحضور"""
+    check_sync_query(since, query)
     try:
+        if since is not None:
+            return await sync_table("StudentAttend", since, query)
+        if use_passthrough("StudentAttend", query):
+            return await stream_envelope("attendance", "StudentAttend")
         attendance = await api_client.get("StudentAttend")
-        return {"attendance": attendance, "status": "success"}
+        attendance, page = query_table("StudentAttend", attendance, query)
+        return {"attendance": attendance, **page, "status": "success"}
     except Exception as e:
         return {"attendance": [], "status": "error", "message": str(e)}
 
 @app.get("/evaluations")
-async def get_evaluations():
+async def get_evaluations(query: ListQuery = Depends(list_query), since: Optional[str] = None):
     """الحصول على التقييمات"""
+    check_sync_query(since, query)
     try:
+        if since is not None:
+            return await sync_table("StudentEvaluation", since, query)
+        if use_passthrough("StudentEvaluation", query):
+            return await stream_envelope("evaluations", "StudentEvaluation")
         evaluations = await api_client.get("StudentEvaluation")
-        return {"evaluations": evaluations, "status": "success"}
+        evaluations, page = query_table("StudentEvaluation", evaluations, query)
+        return {"evaluations": evaluations, **page, "status": "success"}
     except Exception as e:
         return {"evaluations": [], "status": "error", "message": str(e)}
 
@@ -561,18 +3172,382 @@ async def get_student_groups():
         groups = await api_client.get("StudentGroup")
         return {"groups": groups, "status": "success"}
     except Exception as e:
-        return {"groups": [], "status": "error", "message": str(e)}
+        return stale_or_error("groups", "StudentGroup", e)
 
 # نقاط النهاية للدردشة
 @app.get("/chat/messages")
-async def get_chat_messages():
+async def get_chat_messages(query: ListQuery = Depends(list_query)):
     """الحصول على رسائل الدردشة"""
     try:
+        if use_passthrough("Chat", query):
+            return await stream_envelope("messages", "Chat")
         messages = await api_client.get("Chat")
-        return {"messages": messages, "status": "success"}
+        messages, page = query_table("Chat", messages, query)
+        return {"messages": messages, **page, "status": "success"}
     except Exception as e:
         return {"messages": [], "status": "error", "message": str(e)}
 
+# البث الفوري (Server-Sent Events): مستطلع واحد لكل موضوع في كل عامل مهما كان عدد المشتركين
+PUSH_POLL_INTERVAL = float(os.getenv("PUSH_POLL_INTERVAL", "3"))
+PUSH_HEARTBEAT_SECONDS = float(os.getenv("PUSH_HEARTBEAT_SECONDS", "15"))
+PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", "100"))
+PUSH_TOPICS: Dict[str, str] = {
+    "chat": "Chat",
+    "complaints": "ComplaintsStudent",
+}
+
+
+class ChangeFeed:
+    """يستطلع نقطة نهاية دورياً، ويقارن بصمة كل صف بالنسخة السابقة، ويرسل الصفوف المضافة والمتغيرة والمحذوفة فقط
+
+    يعمل الاستطلاع ما دام هناك مشترك واحد على الأقل، فيبقى الحمل على API الخارجي ثابتاً.
+    كل عامل يستطلع بنفسه فيرى كل التغييرات، لكن رقم النسخة (id في SSE) خاص بالعامل.
+    """
+
+    def __init__(self, topic: str, endpoint: str, interval: float = PUSH_POLL_INTERVAL):
+        self.topic = topic
+        self.endpoint = endpoint
+        self.interval = interval
+        self.version = 0
+        self.subscribers: set = set()
+        self._hashes: Optional[Dict[Any, tuple]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, queue: asyncio.Queue):
+        self.subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            # لا نعرف ما تغير أثناء التوقف؛ النسخة التالية تصبح خط أساس جديد
+            self._hashes = None
+
+    def diff(self, rows: Any) -> Optional[Dict[str, Any]]:
+        """تحديث البصمات وإرجاع التغييرات منذ النسخة السابقة (None في أول نسخة أو عند عدم التغيير)"""
+        if not isinstance(rows, list):
+            return None
+        # المفتاح المطبَّع -> (البصمة، المعرّف الأصلي)
+        hashes: Dict[Any, tuple] = {}
+        changed_rows: Dict[Any, Any] = {}
+        for row in rows:
+            digest = _row_hash(row)
+            row_id = _row_id(row, None)
+            key = _index_key(row_id) if row_id is not None else digest
+            hashes[key] = (digest, row_id)
+            if self._hashes is not None and self._hashes.get(key, (None,))[0] != digest:
+                changed_rows[key] = row
+        previous, self._hashes = self._hashes, hashes
+        if previous is None:
+            return None
+        removed = [row_id for key, (_, row_id) in previous.items() if key not in hashes and row_id is not None]
+        if not changed_rows and not removed:
+            return None
+        self.version += 1
+        return {
+            "topic": self.topic,
+            "version": self.version,
+            "added": [row for key, row in changed_rows.items() if key not in previous],
+            "changed": [row for key, row in changed_rows.items() if key in previous],
+            "removed": removed,
+        }
+
+    def publish(self, event: Dict[str, Any]):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # مشترك بطيء: نتخلص مما تراكم ونطلب منه إعادة تحميل القائمة كاملة
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"topic": self.topic, "version": self.version, "reset": True})
+
+    async def poll_once(self):
+        rows = await api_client.refresh(self.endpoint)
+        event = self.diff(rows)
+        if event is not None:
+            self.publish(event)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                # تعطل مؤقت في API الخارجي: نحاول في الدورة التالية
+                pass
+            await asyncio.sleep(self.interval)
+
+
+class ChangeFeeds:
+    def __init__(self, topics: Dict[str, str]):
+        self.feeds = {topic: ChangeFeed(topic, endpoint) for topic, endpoint in topics.items()}
+
+    async def close(self):
+        for feed in self.feeds.values():
+            for queue in list(feed.subscribers):
+                feed.unsubscribe(queue)
+
+
+change_feeds = ChangeFeeds(PUSH_TOPICS)
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['version']}\nevent: {event['topic']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def event_stream(feeds: List[ChangeFeed]):
+    queue: asyncio.Queue = asyncio.Queue(PUSH_QUEUE_SIZE)
+    for feed in feeds:
+        feed.subscribe(queue)
+    try:
+        # إعادة الاتصال للعميل بعد 3 ثوانٍ عند الانقطاع
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), PUSH_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # تعليق يبقي الاتصال حياً عبر الوسطاء
+                yield ": heartbeat\n\n"
+                continue
+            yield _sse(event)
+    finally:
+        for feed in feeds:
+            feed.unsubscribe(queue)
+
+
+@app.get("/events")
+async def get_events(topics: str = Query("chat,complaints")):
+    """بث التغييرات الجديدة (SSE) في رسائل الدردشة والشكاوى بدلاً من الاستطلاع المتكرر
+
+    كل حدث يحوي الصفوف المضافة والمتغيرة ومعرّفات المحذوفة؛ الحدث reset يعني إعادة تحميل القائمة كاملة.
+    """
+    names = [name.strip() for name in topics.split(",") if name.strip()]
+    unknown = [name for name in names if name not in change_feeds.feeds]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(unknown) or topics}")
+    feeds = [change_feeds.feeds[name] for name in names]
+    return StreamingResponse(
+        event_stream(feeds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# البحث المحلي: فهرس مقلوب فوق نسخ API الخارجي المخزنة مع تطبيع عربي ومطابقة البادئة
+SEARCH_SOURCES: Dict[str, str] = {
+    "courses": "AcademyClaseDetail",
+    "programs": "ProgramsContentMaster",
+    "teachers": "TeacherData",
+    "questions": "QuestionBankMaster",
+}
+SEARCH_MAX_LIMIT = 100
+
+_ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ی": "ي"})
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """حذف التشكيل والتطويل وتوحيد أشكال الألف والياء وحالة الأحرف اللاتينية"""
+    return _ARABIC_DIACRITICS.sub("", text).translate(_ARABIC_LETTERS).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize_text(text))
+
+
+def _row_id(row: Any, position: int) -> Any:
+    if isinstance(row, dict):
+        for name in ("id", "Id", "ID"):
+            if name in row:
+                return row[name]
+    return position
+
+
+def _row_text(row: Any) -> str:
+    if isinstance(row, dict):
+        return " ".join(str(value) for value in row.values() if isinstance(value, (str, int)) and not isinstance(value, bool))
+    return str(row)
+
+
+class SearchIndex:
+    """فهرس مقلوب (رمز -> مستندات) يُحدَّث تدريجياً: عند تغير نسخة مصدر يُعاد فهرسة الصفوف المتغيرة فقط"""
+
+    def __init__(self, sources: Dict[str, str]):
+        self.sources = sources
+        self.postings: Dict[str, set] = {}
+        self.documents: Dict[tuple, tuple] = {}
+        self._source_docs: Dict[str, Dict[Any, str]] = {name: {} for name in sources}
+        self._synced: Dict[str, Any] = {}
+        self._vocabulary: Optional[List[str]] = None
+
+    def sync(self, source: str, rows: Any):
+        """مزامنة مصدر مع أحدث نسخة؛ لا شيء يحدث إذا كانت النسخة نفسها"""
+        if self._synced.get(source) is rows or not isinstance(rows, list):
+            return
+        previous = self._source_docs[source]
+        current: Dict[Any, str] = {}
+        for position, row in enumerate(rows):
+            doc_id = _row_id(row, position)
+            text = _row_text(row)
+            current[doc_id] = text
+            if previous.get(doc_id) != text:
+                self._remove((source, doc_id))
+                self._add((source, doc_id), row, text)
+            else:
+                # الصف لم يتغير نصياً؛ تحديث الكائن المُعاد فقط
+                _, tokens = self.documents[(source, doc_id)]
+                self.documents[(source, doc_id)] = (row, tokens)
+        for doc_id in previous.keys() - current.keys():
+            self._remove((source, doc_id))
+        self._source_docs[source] = current
+        self._synced[source] = rows
+
+    def _add(self, doc: tuple, row: Any, text: str):
+        tokens = set(tokenize(text))
+        self.documents[doc] = (row, tokens)
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                self._vocabulary = None
+            self.postings[token].add(doc)
+
+    def _remove(self, doc: tuple):
+        entry = self.documents.pop(doc, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.discard(doc)
+                if not postings:
+                    del self.postings[token]
+                    self._vocabulary = None
+
+    def _prefix_matches(self, prefix: str) -> set:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        matches: set = set()
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            matches |= self.postings[self._vocabulary[position]]
+            position += 1
+        return matches
+
+    def search(self, query: str, types: Optional[List[str]] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """كل رموز الاستعلام يجب أن تطابق (كرمز كامل أو بادئة)؛ المطابقة الكاملة ترفع الترتيب"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        candidates: Optional[set] = None
+        for term in terms:
+            matches = self._prefix_matches(term)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+        if types:
+            candidates = {doc for doc in candidates if doc[0] in types}
+        scored = []
+        for doc in candidates:
+            row, tokens = self.documents[doc]
+            score = sum(2 if term in tokens else 1 for term in terms)
+            scored.append((score, doc))
+        scored.sort(key=lambda item: -item[0])
+        return [{"type": doc[0], "id": doc[1], "score": score, "item": self.documents[doc][0]}
+                for score, doc in scored[:limit]]
+
+    async def refresh(self, client: APIClient):
+        """قراءة المصادر (من الذاكرة المؤقتة غالباً) ومزامنة ما تغير منها"""
+        names = list(self.sources)
+        results = await asyncio.gather(*(client.get(self.sources[name]) for name in names), return_exceptions=True)
+        for name, rows in zip(names, results):
+            if not isinstance(rows, BaseException):
+                self.sync(name, rows)
+
+
+search_index = SearchIndex(SEARCH_SOURCES)
+
+
+@app.get("/search")
+async def search(q: str = Query(..., min_length=1), types: Optional[str] = None,
+                 limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT)):
+    """البحث في الدورات والبرامج والمعلمين وبنك الأسئلة، مثال: /search?q=برمجة&types=courses,programs"""
+    await search_index.refresh(api_client)
+    selected = [name.strip() for name in types.split(",") if name.strip()] if types else None
+    results = search_index.search(q, selected, limit)
+    return {"results": results, "count": len(results), "status": "success"}
+
+# نقطة نهاية مجمّعة: جلب عدة موارد في طلب واحد
+# اسم المسار -> (مفتاح الغلاف، نقطة نهاية API الخارجي)، بنفس شكل استجابة المسار المنفرد
+BATCH_ROUTES: Dict[str, tuple] = {
+    "courses": ("courses", "AcademyClaseDetail"),
+    "course-masters": ("masters", "AcademyClaseMaster"),
+    "course-types": ("types", "AcademyClaseType"),
+    "academy-data": ("data", "AcademyData"),
+    "jobs": ("jobs", "AcademyJob"),
+    "branches": ("branches", "BranchData"),
+    "programs": ("programs", "ProgramsContentMaster"),
+    "program-details": ("details", "ProgramsContentDetail"),
+    "projects": ("projects", "ProjectsMaster"),
+    "project-details": ("details", "ProjectsDetail"),
+    "skill-development": ("skills", "SkillDevelopment"),
+    "teachers": ("teachers", "TeacherData"),
+    "question-bank": ("questions", "QuestionBankMaster"),
+    "complaint-types": ("types", "ComplaintsType"),
+    # "status" محجوز لعلامة النجاح في الغلاف
+    "complaint-status": ("statuses", "ComplaintsStatus"),
+    "countries": ("countries", "CountryCode"),
+    "governorates": ("governorates", "GovernorateCode"),
+    "cities": ("cities", "CityCode"),
+    "student-groups": ("groups", "StudentGroup"),
+}
+
+# ما تطلبه الواجهة الأمامية عند بدء التشغيل
+BOOTSTRAP_ROUTES = os.getenv(
+    "BOOTSTRAP_ROUTES",
+    "courses,course-masters,course-types,branches,programs,projects,skill-development,jobs,academy-data,"
+    "countries,governorates,cities",
+).split(",")
+
+
+async def _batch_part(name: str) -> Dict[str, Any]:
+    route = BATCH_ROUTES.get(name)
+    if route is None:
+        return {"status": "error", "message": f"Unknown route: {name}"}
+    key, endpoint = route
+    try:
+        return {key: await api_client.get(endpoint), "status": "success"}
+    except Exception as e:
+        return stale_or_error(key, endpoint, e)
+
+
+async def resolve_batch(names: List[str]) -> Dict[str, Any]:
+    """جلب الأجزاء بالتوازي؛ فشل جزء لا يُفشل الاستجابة كلها"""
+    names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+    parts = await asyncio.gather(*(_batch_part(name) for name in names))
+    return {"results": dict(zip(names, parts)), "status": "success"}
+
+
+@app.get("/batch")
+async def get_batch(routes: str):
+    """جلب عدة مسارات في طلب واحد، مثال: /batch?routes=courses,branches"""
+    return await resolve_batch(routes.split(","))
+
+@app.post("/batch")
+async def post_batch(batch_data: dict):
+    """جلب عدة مسارات في طلب واحد: {"routes": ["courses", "branches"]}"""
+    routes = batch_data.get("routes")
+    if not isinstance(routes, list) or not all(isinstance(name, str) for name in routes):
+        raise HTTPException(status_code=400, detail="routes must be a list of route names")
+    return await resolve_batch(routes)
+
+@app.get("/bootstrap")
+async def get_bootstrap():
+    """كل ما تحتاجه الواجهة الأمامية عند بدء التشغيل في طلب واحد"""
+    return await resolve_batch(BOOTSTRAP_ROUTES)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
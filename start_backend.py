@@ -1,11 +1,33 @@
 #!/usr/bin/env python3
 """
 سكريبت تشغيل الـ Backend لأكاديمية الإبداع
+
+يشغّل عدة عمّال uvicorn (افتراضياً بعدد المعالجات المتاحة) مع uvloop و httptools عند توفرهما،
+وضبط طابور الاتصالات ومهلة keep-alive وإيقاف تدريجي ينهي الطلبات الجارية قبل الخروج.
+عند تعدد العمّال تُفعَّل ذاكرة مؤقتة مشتركة بينهم (SHARED_CACHE_BACKEND) حتى لا يجلب كل عامل
+نسخته من بيانات API الخارجي.
 """
 
-import uvicorn
+import importlib.util
 import os
-from main import app
+
+import uvicorn
+
+
+def available_cpus() -> int:
+    """عدد المعالجات المتاحة للعملية (يحترم حدود الحاويات عند توفرها)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pick(setting: str, fast: str, fallback: str) -> str:
+    """اختيار التطبيق الأسرع إن كان مثبتاً ما لم يُحدَّد صراحة"""
+    if setting != "auto":
+        return setting
+    return fast if importlib.util.find_spec(fast) is not None else fallback
+
 
 if __name__ == "__main__":
     # إعدادات التشغيل
@@ -13,15 +35,47 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
     reload_flag = os.getenv("RELOAD", "false").lower() == "true"
     log_level = os.getenv("LOG_LEVEL", "info")
-    
+
+    # عدد العمّال: WORKERS ثم WEB_CONCURRENCY (المستخدم في Heroku) ثم عدد المعالجات
+    workers = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", str(available_cpus()))))
+    if reload_flag:
+        # وضع إعادة التحميل للتطوير فقط ولا يعمل مع تعدد العمّال
+        workers = 1
+    loop = pick(os.getenv("LOOP", "auto"), "uvloop", "asyncio")
+    http = pick(os.getenv("HTTP", "auto"), "httptools", "h11")
+
+    # طابور الاتصالات المنتظرة، ومهلة keep-alive أطول من مهلة موازن الحمل (عادة 60 ثانية)
+    # حتى لا يغلق الخادم اتصالاً يوشك الموازن على إعادة استخدامه
+    backlog = int(os.getenv("BACKLOG", "2048"))
+    keep_alive = int(os.getenv("KEEP_ALIVE_TIMEOUT", "75"))
+    # مهلة إنهاء الطلبات الجارية عند الإيقاف قبل إغلاقها قسراً
+    graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+    # إنهاء الخادم بعد عدد من الطلبات (0 = بلا حد) ليعيد تشغيله مدير العمليات (systemd/Heroku)؛
+    # مع عمّال uvicorn المتعددين لا يُعاد تشغيل العامل المنتهي فيُتجاهل الإعداد
+    max_requests = int(os.getenv("MAX_REQUESTS", "0")) or None
+    if max_requests and workers > 1:
+        print("⚠️ MAX_REQUESTS يعمل مع عامل واحد فقط؛ تم تجاهله")
+        max_requests = None
+
+    if workers > 1:
+        # يُقرأ في كل عامل عند استيراد main
+        os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+
     # طباعة مختصرة فقط عند البدء
-    print(f"🚀 بدء تشغيل الخادم على: http://{host}:{port}")
-    
+    print(f"🚀 بدء تشغيل الخادم على: http://{host}:{port} ({workers} عمّال، {loop}/{http})")
+
     # تشغيل الخادم
     uvicorn.run(
-        app,
+        "main:app",
         host=host,
         port=port,
         reload=reload_flag,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        timeout_keep_alive=keep_alive,
+        timeout_graceful_shutdown=graceful_timeout,
+        limit_max_requests=max_requests,
         log_level=log_level
-    ) 
\ No newline at end of file
+    )